@@ -23,15 +23,15 @@ print(
 # Strikes
 strikes = [(i + 1) / 1000 for i in range(100)]
 # implied volatility
-vols1 = [model1.normalVolatility(strike) for strike in strikes]
-vols2 = [model2.normalVolatility(strike) for strike in strikes]
-vols3 = [model3.normalVolatility(strike) for strike in strikes]
-vols4 = [model4.normalVolatility(strike) for strike in strikes]
+vols1 = model1.normalVolatility(np.array(strikes))
+vols2 = model2.normalVolatility(np.array(strikes))
+vols3 = model3.normalVolatility(np.array(strikes))
+vols4 = model4.normalVolatility(np.array(strikes))
 # implied density
-dens1 = [model1.density(strike) for strike in strikes]
-dens2 = [model2.density(strike) for strike in strikes]
-dens3 = [model3.density(strike) for strike in strikes]
-dens4 = [model4.density(strike) for strike in strikes]
+dens1 = model1.density(np.array(strikes))
+dens2 = model2.density(np.array(strikes))
+dens3 = model3.density(np.array(strikes))
+dens4 = model4.density(np.array(strikes))
 
 plt.figure()
 plt.plot(strikes, vols1, "b-", label="Normal")
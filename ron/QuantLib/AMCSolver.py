@@ -6,53 +6,115 @@ from Regression import Regression
 
 from Payoffs import SwapRate
 
+# regressor strategies map states x0 [nPaths, size] at T0 to regression
+# controls [nPaths, nControls]
+
+
+class StateRegressors:
+    # we try state variable approach
+    def at(self, model, T0, x0):
+        return x0[:, :1]
+
+
+class CoterminalRateLiborRegressors:
+    # co-terminal swap rate S and Libor rate L as basis functions
+
+    # Python constructor
+    def __init__(self, maturityTime=20.0):
+        self.maturityTime = maturityTime
+
+    def at(self, model, T0, x0):
+        S = SwapRate(model, T0, T0, self.maturityTime).atBatch(x0)
+        L = SwapRate(model, T0, T0, T0 + 0.5).atBatch(x0)
+        return np.stack([S, L], axis=1)
+
+
+class CoterminalRateOptionRegressors:
+    # co-terminal swap rate S and [S-K]^+ as basis functions
+
+    # Python constructor
+    def __init__(self, maturityTime=20.0, strikeRate=0.03):
+        self.maturityTime = maturityTime
+        self.strikeRate = strikeRate
+
+    def at(self, model, T0, x0):
+        S = SwapRate(model, T0, T0, self.maturityTime).atBatch(x0)
+        return np.stack([S, np.maximum(S - self.strikeRate, 0.0)], axis=1)
+
+
+# target strategies specify what is regressed and how roll-back values are
+# derived; N0, N1, U1, H1 and regressed values are arrays over all paths
+
+
+class ContinuationValueRegression:
+    # regress discounted max(U, H) and use the regression as roll-back value
+    def observations(self, N0, N1, U1, H1):
+        return N0 / N1 * np.maximum(U1, H1)
+
+    def values(self, N0, N1, U1, H1, regressed):
+        if regressed is None:
+            return N0 / N1 * np.maximum(U1, H1)
+        return regressed
+
+
+class ExerciseRegression:
+    # regress U - H only for the exercise decision, roll back actual values
+    def observations(self, N0, N1, U1, H1):
+        return U1 - H1
+
+    def values(self, N0, N1, U1, H1, regressed):
+        I = U1 - H1 if regressed is None else regressed
+        return N0 / N1 * np.where(I > 0, U1, H1)
+
 
 class AMCSolver:
 
     # Python constructor
-    def __init__(self, hwMcSimulation, maxPolynomialDegree=2, splitRatio=0.25):
+    def __init__(
+        self,
+        hwMcSimulation,
+        maxPolynomialDegree=2,
+        splitRatio=0.25,
+        regressors=None,
+        target=None,
+    ):
         self.hwMcSimulation = hwMcSimulation
         self.maxPolynomialDegree = maxPolynomialDegree
         self.minSampleIdx = int(
             splitRatio * self.hwMcSimulation.nPaths
         )  # we split training data and simulation data
+        self.regressors = StateRegressors() if regressors is None else regressors
+        self.target = ContinuationValueRegression() if target is None else target
 
     def getIndexWithTolerance(self, t):
         return np.where(abs(self.hwMcSimulation.times - t) < 1.0e-8)[0][0]
 
     def xSet(self, expiryTime):
         idx = self.getIndexWithTolerance(expiryTime)
-        return np.array(
-            [
-                self.hwMcSimulation.X[i][idx]
-                for i in range(self.hwMcSimulation.X.shape[0])
-            ]
-        )
+        return self.hwMcSimulation.X[:, idx]
+
+    def numeraires(self, x):
+        model = self.hwMcSimulation.model
+        if hasattr(model, "numeraireBatch"):
+            return model.numeraireBatch(x)
+        return np.array([model.numeraire(state) for state in x])
 
     def rollBack(self, T0, T1, x1, U1, H1):
         x0 = self.xSet(T0)
-        N0 = np.array(
-            [self.hwMcSimulation.model.numeraire(x0[i]) for i in range(x1.shape[0])]
-        )
-        N1 = np.array(
-            [self.hwMcSimulation.model.numeraire(x1[i]) for i in range(x1.shape[0])]
-        )
+        N0 = self.numeraires(x0)
+        N1 = self.numeraires(x1)
+        if len(U1.shape) == 2:  # portfolio [nPaths, nTrades]
+            [N0, N1] = [N0[:, np.newaxis], N1[:, np.newaxis]]
+        regressed = None
         if (
             self.minSampleIdx > 0 and T0 > 0
         ):  # do not use regression for the last roll-back
-            # we try state variable approach
-            C = np.array([[x0[i][0]] for i in range(self.minSampleIdx)])
-            O = np.array(
-                [N0[i] / N1[i] * max(U1[i], H1[i]) for i in range(self.minSampleIdx)]
-            )
-            R = Regression(C, O, self.maxPolynomialDegree)
-        else:
-            R = None
-        V0 = np.zeros(x1.shape[0])
-        for i in range(x1.shape[0]):
-            V0[i] = N0[i] / N1[i] * max(U1[i], H1[i])
-            if R != None:
-                V0[i] = R.value(np.array([x0[i][0]]))
+            C = self.regressors.at(self.hwMcSimulation.model, T0, x0)
+            m = self.minSampleIdx
+            O = self.target.observations(N0[:m], N1[:m], U1[:m], H1[:m])
+            R = Regression(C[:m], O, self.maxPolynomialDegree)
+            regressed = R.valueBatch(C)
+        V0 = self.target.values(N0, N1, U1, H1, regressed)
         if T0 == 0:
             sampleIdx = (
                 self.minSampleIdx
@@ -61,7 +123,7 @@ class AMCSolver:
             )
             return [
                 np.array([0.0]),
-                np.array([np.sum(V0[sampleIdx:]) / V0[sampleIdx:].shape[0]]),
+                np.sum(V0[sampleIdx:], axis=0, keepdims=True) / V0[sampleIdx:].shape[0],
             ]
         return [x0, V0]
 
@@ -70,43 +132,14 @@ class AMCSolverOnlyExerciseRegression(AMCSolver):
 
     # Python constructor
     def __init__(self, hwMcSimulation, maxPolynomialDegree=2, splitRatio=0.25):
-        AMCSolver.__init__(self, hwMcSimulation, maxPolynomialDegree, splitRatio)
-
-    def rollBack(self, T0, T1, x1, U1, H1):
-        x0 = self.xSet(T0)
-        N0 = np.array(
-            [self.hwMcSimulation.model.numeraire(x0[i]) for i in range(x1.shape[0])]
-        )
-        N1 = np.array(
-            [self.hwMcSimulation.model.numeraire(x1[i]) for i in range(x1.shape[0])]
+        AMCSolver.__init__(
+            self,
+            hwMcSimulation,
+            maxPolynomialDegree,
+            splitRatio,
+            StateRegressors(),
+            ExerciseRegression(),
         )
-        if (
-            self.minSampleIdx > 0 and T0 > 0
-        ):  # do not use regression for the last roll-back
-            # we try state variable approach
-            C = np.array([[x0[i][0]] for i in range(self.minSampleIdx)])
-            O = np.array([U1[i] - H1[i] for i in range(self.minSampleIdx)])
-            R = Regression(C, O, self.maxPolynomialDegree)
-        else:
-            R = None
-        V0 = np.zeros(x1.shape[0])
-        for i in range(x1.shape[0]):
-            I = U1[i] - H1[i]
-            if R != None:
-                I = R.value(np.array([x0[i][0]]))
-            V = U1[i] if I > 0 else H1[i]
-            V0[i] = N0[i] / N1[i] * V
-        if T0 == 0:
-            sampleIdx = (
-                self.minSampleIdx
-                if self.minSampleIdx < self.hwMcSimulation.nPaths
-                else 0
-            )
-            return [
-                np.array([0.0]),
-                np.array([np.sum(V0[sampleIdx:]) / V0[sampleIdx:].shape[0]]),
-            ]
-        return [x0, V0]
 
 
 class AMCSolverCoterminalRateRegression(AMCSolver):
@@ -120,54 +153,17 @@ class AMCSolverCoterminalRateRegression(AMCSolver):
         maturityTime=20.0,
         strikeRate=0.03,
     ):
-        AMCSolver.__init__(self, hwMcSimulation, maxPolynomialDegree, splitRatio)
+        AMCSolver.__init__(
+            self,
+            hwMcSimulation,
+            maxPolynomialDegree,
+            splitRatio,
+            CoterminalRateLiborRegressors(maturityTime),
+            ContinuationValueRegression(),
+        )
         self.maturityTime = maturityTime
         self.strikeRate = strikeRate
 
-    def rollBack(self, T0, T1, x1, U1, H1):
-        x0 = self.xSet(T0)
-        N0 = np.array(
-            [self.hwMcSimulation.model.numeraire(x0[i]) for i in range(x1.shape[0])]
-        )
-        N1 = np.array(
-            [self.hwMcSimulation.model.numeraire(x1[i]) for i in range(x1.shape[0])]
-        )
-        # we need to calculate regression variables for all paths
-        swapRate = SwapRate(self.hwMcSimulation.model, T0, T0, self.maturityTime)
-        liborRate = SwapRate(self.hwMcSimulation.model, T0, T0, T0 + 0.5)
-        S = np.array([swapRate.at(x) for x in x0])
-        L = np.array([liborRate.at(x) for x in x0])
-        # Sp = np.array([ max(s-self.strikeRate,0.0) for s in S ])
-        if (
-            self.minSampleIdx > 0 and T0 > 0
-        ):  # do not use regression for the last roll-back
-            # we use S and [S-K]^+ as basis functions
-            # C = np.array([ [ S[i], Sp[i] ] for i in range(self.minSampleIdx) ])
-            C = np.array([[S[i], L[i]] for i in range(self.minSampleIdx)])
-            O = np.array(
-                [N0[i] / N1[i] * max(U1[i], H1[i]) for i in range(self.minSampleIdx)]
-            )
-            R = Regression(C, O, self.maxPolynomialDegree)
-        else:
-            R = None
-        V0 = np.zeros(x1.shape[0])
-        for i in range(x1.shape[0]):
-            V0[i] = N0[i] / N1[i] * max(U1[i], H1[i])
-            # if R!=None: V0[i] = R.value(np.array([ S[i], Sp[i] ]))
-            if R != None:
-                V0[i] = R.value(np.array([S[i], L[i]]))
-        if T0 == 0:
-            sampleIdx = (
-                self.minSampleIdx
-                if self.minSampleIdx < self.hwMcSimulation.nPaths
-                else 0
-            )
-            return [
-                np.array([0.0]),
-                np.array([np.sum(V0[sampleIdx:]) / V0[sampleIdx:].shape[0]]),
-            ]
-        return [x0, V0]
-
 
 class AMCSolverCoterminalRateOnlyExerciseRegression(AMCSolver):
 
@@ -180,50 +176,13 @@ class AMCSolverCoterminalRateOnlyExerciseRegression(AMCSolver):
         maturityTime=20.0,
         strikeRate=0.03,
     ):
-        AMCSolver.__init__(self, hwMcSimulation, maxPolynomialDegree, splitRatio)
+        AMCSolver.__init__(
+            self,
+            hwMcSimulation,
+            maxPolynomialDegree,
+            splitRatio,
+            CoterminalRateOptionRegressors(maturityTime, strikeRate),
+            ExerciseRegression(),
+        )
         self.maturityTime = maturityTime
         self.strikeRate = strikeRate
-
-    def rollBack(self, T0, T1, x1, U1, H1):
-        x0 = self.xSet(T0)
-        N0 = np.array(
-            [self.hwMcSimulation.model.numeraire(x0[i]) for i in range(x1.shape[0])]
-        )
-        N1 = np.array(
-            [self.hwMcSimulation.model.numeraire(x1[i]) for i in range(x1.shape[0])]
-        )
-        # we need to calculate regression variables for all paths
-        swapRate = SwapRate(self.hwMcSimulation.model, T0, T0, self.maturityTime)
-        # liborRate = SwapRate(self.hwMcSimulation.model,T0,T0,T0+0.5)
-        S = np.array([swapRate.at(x) for x in x0])
-        # L  = np.array([ liborRate.at(x) for x in x0 ])
-        Sp = np.array([max(s - self.strikeRate, 0.0) for s in S])
-        if (
-            self.minSampleIdx > 0 and T0 > 0
-        ):  # do not use regression for the last roll-back
-            # we use S and [S-K]^+ as basis functions
-            C = np.array([[S[i], Sp[i]] for i in range(self.minSampleIdx)])
-            # C = np.array([ [ S[i], L[i] ] for i in range(self.minSampleIdx) ])
-            O = np.array([U1[i] - H1[i] for i in range(self.minSampleIdx)])
-            R = Regression(C, O, self.maxPolynomialDegree)
-        else:
-            R = None
-        V0 = np.zeros(x1.shape[0])
-        for i in range(x1.shape[0]):
-            I = U1[i] - H1[i]
-            if R != None:
-                I = R.value(np.array([S[i], Sp[i]]))
-            # if R!=None: I = R.value(np.array([ S[i], L[i] ]))
-            V = U1[i] if I > 0 else H1[i]
-            V0[i] = N0[i] / N1[i] * V
-        if T0 == 0:
-            sampleIdx = (
-                self.minSampleIdx
-                if self.minSampleIdx < self.hwMcSimulation.nPaths
-                else 0
-            )
-            return [
-                np.array([0.0]),
-                np.array([np.sum(V0[sampleIdx:]) / V0[sampleIdx:].shape[0]]),
-            ]
-        return [x0, V0]
@@ -3,7 +3,24 @@
 import numpy as np
 
 
+# evaluate an underlying on the states x of a roll-back method; a list of
+# underlyings (one per trade) gives values [nStates, nTrades]
+def underlyingValues(underlying, x):
+    if isinstance(underlying, (list, tuple)):
+        return np.stack([underlyingValues(u, x) for u in underlying], axis=1)
+    if len(x.shape) == 1:  # PDE and density integration
+        if hasattr(underlying, "atBatch"):
+            return underlying.atBatch(np.stack([x, np.zeros(x.shape[0])], axis=1))
+        return np.array([underlying.at([state, 0.0]) for state in x])
+    if hasattr(underlying, "atBatch"):  # MC simulation
+        return underlying.atBatch(x)
+    return np.array([underlying.at(state) for state in x])
+
+
 class BermudanOption:
+    # underlyings[k] is the payoff U_k(x) at expiry k, or a list of payoffs
+    # to price a portfolio of Bermudans with common exercise dates in one
+    # pass; then U and H are [nStates, nTrades] and npv() is [nTrades]
 
     # Python constructor
     def __init__(self, expiryTimes, underlyings, method):
@@ -15,13 +32,11 @@ class BermudanOption:
             print(".", end="", flush=True)
             if k == expiryTimes.shape[0]:
                 x = method.xSet(expiryTimes[k - 1])
-                H = np.zeros(x.shape[0])
             else:
                 [x, H] = method.rollBack(expiryTimes[k - 1], expiryTimes[k], x, U, H)
-            if len(x.shape) == 1:  # PDE and density integration
-                U = np.array([underlyings[k - 1].at([state, 0.0]) for state in x])
-            else:  # MC simulation
-                U = np.array([underlyings[k - 1].at(state) for state in x])
+            U = underlyingValues(underlyings[k - 1], x)
+            if k == expiryTimes.shape[0]:
+                H = np.zeros(U.shape)
         [x, H] = method.rollBack(0.0, expiryTimes[0], x, U, H)
         self.x = x
         self.H = H
@@ -30,6 +45,8 @@ class BermudanOption:
     def npv(self):
         if self.H.shape[0] == 1:
             return self.H[0]
+        if len(self.H.shape) == 2:  # portfolio
+            return np.array([np.interp(0.0, self.x, H) for H in self.H.T])
         return np.interp(0.0, self.x, self.H)
 
 
@@ -39,10 +56,7 @@ class EuropeanPayoff(BermudanOption):
     # Python constructor
     def __init__(self, expiryTime, underlying, method):
         x = method.xSet(expiryTime)
-        if len(x.shape) == 1:  # PDE and density integration
-            U = np.array([underlying.at([state, 0.0]) for state in x])
-        else:  # MC simulation
-            U = np.array([underlying.at(state) for state in x])
+        U = underlyingValues(underlying, x)
         [x, H] = method.rollBack(0.0, expiryTime, x, U, U)
         self.x = x
         self.H = H
@@ -1,18 +1,22 @@
 #!/usr/bin/python
 
+from collections import OrderedDict
+
 import numpy as np
-from scipy.stats import norm
 from scipy import integrate
+from scipy.special import ndtr
 from scipy.interpolate import CubicSpline
 
 
 class DensityIntegration:  # base class for other integration methods
 
     # Python constructor
-    def __init__(self, hwModel, nGridPoints=101, stdDevs=5):
+    def __init__(self, hwModel, nGridPoints=101, stdDevs=5, cacheSize=32):
         self.hwModel = hwModel
         self.nGridPoints = nGridPoints
         self.stdDevs = stdDevs
+        self.cacheSize = cacheSize
+        self.operators = OrderedDict()  # LRU cache of roll-back operators
 
     def xSet(self, expityTime):
         sigma = np.sqrt(self.hwModel.varianceX(0.0, expityTime))
@@ -22,6 +26,25 @@ class DensityIntegration:  # base class for other integration methods
             -self.stdDevs * sigma, self.stdDevs * sigma, self.nGridPoints
         )
 
+    # linear roll-back operator M [N0, N1] with V0(x0) = M V(x1); operators
+    # are cached and reused when (T0, T1, x1) repeat across exercise dates
+    # or trades, methods provide transitionMatrix(T0, T1, x0, x1)
+    def operator(self, T0, T1, x1):
+        key = (T0, T1, x1.tobytes())
+        if key in self.operators:
+            self.operators.move_to_end(key)
+            return self.operators[key]
+        x0 = self.xSet(T0)
+        self.operators[key] = [x0, self.transitionMatrix(T0, T1, x0, x1)]
+        if len(self.operators) > self.cacheSize:
+            self.operators.popitem(last=False)  # drop least recently used
+        return self.operators[key]
+
+    # U1, H1 may be [N1] or [N1, nTrades] for a portfolio
+    def rollBack(self, T0, T1, x1, U1, H1):
+        [x0, M] = self.operator(T0, T1, x1)
+        return [x0, M.dot(np.maximum(U1, H1))]
+
 
 class DensityIntegrationWithBreakEven(
     DensityIntegration
@@ -35,6 +58,12 @@ class DensityIntegrationWithBreakEven(
         self.method = method
 
     def rollBack(self, T0, T1, x1, U1, H1):
+        if len(U1.shape) == 2:  # portfolio, break-even states differ per trade
+            V0 = [
+                self.rollBack(T0, T1, x1, U1[:, j], H1[:, j])[1]
+                for j in range(U1.shape[1])
+            ]
+            return [self.xSet(T0), np.stack(V0, axis=1)]
         # find break-even state and split grid
         roots = CubicSpline(x1, U1 - H1).roots(discontinuity=False, extrapolate=False)
         if roots.shape[0] == 0:  # no break even point found
@@ -60,95 +89,74 @@ class DensityIntegrationWithBreakEven(
 class SimpsonIntegration(DensityIntegration):
 
     # Python constructor
-    def __init__(self, hwModel, nGridPoints=101, stdDevs=5):
-        DensityIntegration.__init__(self, hwModel, nGridPoints, stdDevs)
+    def __init__(self, hwModel, nGridPoints=101, stdDevs=5, cacheSize=32):
+        DensityIntegration.__init__(self, hwModel, nGridPoints, stdDevs, cacheSize)
 
-    def rollBack(self, T0, T1, x1, U1, H1):
-        x0 = self.xSet(T0)
-        V0 = np.zeros(x0.shape[0])
+    def transitionMatrix(self, T0, T1, x0, x1):
+        # discounted Gaussian transition kernel times Simpson weights
         sigma = np.sqrt(self.hwModel.varianceX(T0, T1))
-        V = np.array([max(U1[k], H1[k]) for k in range(U1.shape[0])])
-        for i in range(x0.shape[0]):
-            mu = self.hwModel.expectationX(T0, x0[i], T1)
-            fx = np.array(
-                [
-                    V[k] * norm.pdf((x1[k] - mu) / sigma) / sigma
-                    for k in range(x1.shape[0])
-                ]
-            )
-            I = integrate.simps(fx, x1)
-            V0[i] = self.hwModel.zeroBond(T0, x0[i], T1) * I
-        return [x0, V0]
+        mu = self.hwModel.expectationX(T0, x0, T1)
+        z = (x1[np.newaxis, :] - mu[:, np.newaxis]) / sigma
+        kernel = np.exp(-0.5 * z * z) / np.sqrt(2.0 * np.pi) / sigma
+        weights = integrate.simpson(np.eye(x1.shape[0]), x=x1)
+        zeroBonds = self.hwModel.zeroBond(T0, x0, T1)
+        return zeroBonds[:, np.newaxis] * kernel * weights[np.newaxis, :]
 
 
 class HermiteIntegration(DensityIntegration):
 
     # Python constructor
-    def __init__(self, hwModel, degree, nGridPoints=101, stdDevs=5):
-        DensityIntegration.__init__(self, hwModel, nGridPoints, stdDevs)
+    def __init__(self, hwModel, degree, nGridPoints=101, stdDevs=5, cacheSize=32):
+        DensityIntegration.__init__(self, hwModel, nGridPoints, stdDevs, cacheSize)
         (self.hermX, self.hermW) = np.polynomial.hermite.hermgauss(degree)
 
-    def rollBack(self, T0, T1, x1, U1, H1):
-        x0 = self.xSet(T0)
-        V0 = np.zeros(x0.shape[0])
+    def transitionMatrix(self, T0, T1, x0, x1):
+        # cubic spline interpolation is linear in the grid values; the spline
+        # basis is evaluated at all points (x0[i], hermX[k]) in a single call
         sigma = np.sqrt(self.hwModel.varianceX(T0, T1))
-        V = CubicSpline(x1, np.array([max(U1[k], H1[k]) for k in range(U1.shape[0])]))
-        for i in range(x0.shape[0]):
-            mu = self.hwModel.expectationX(T0, x0[i], T1)
-            I = 0.0
-            for k in range(self.hermX.shape[0]):
-                I += self.hermW[k] * V(np.sqrt(2.0) * sigma * self.hermX[k] + mu)
-            I /= np.sqrt(np.pi)
-            V0[i] = self.hwModel.zeroBond(T0, x0[i], T1) * I
-        return [x0, V0]
+        mu = self.hwModel.expectationX(T0, x0, T1)
+        points = np.sqrt(2.0) * sigma * self.hermX[np.newaxis, :] + mu[:, np.newaxis]
+        basis = CubicSpline(x1, np.eye(x1.shape[0]))(points)  # [N0, degree, N1]
+        M = np.tensordot(self.hermW / np.sqrt(np.pi), basis, axes=([0], [1]))
+        zeroBonds = self.hwModel.zeroBond(T0, x0, T1)
+        return zeroBonds[:, np.newaxis] * M
 
 
 class CubicSplineExactIntegration(DensityIntegration):
 
     # Python constructor
-    def __init__(self, hwModel, nGridPoints=101, stdDevs=5):
-        DensityIntegration.__init__(self, hwModel, nGridPoints, stdDevs)
-
-    def rollBack(self, T0, T1, x1, U1, H1):
-        x0 = self.xSet(T0)
-        V0 = np.zeros(x0.shape[0])
+    def __init__(self, hwModel, nGridPoints=101, stdDevs=5, cacheSize=32):
+        DensityIntegration.__init__(self, hwModel, nGridPoints, stdDevs, cacheSize)
+
+    def transitionMatrix(self, T0, T1, x0, x1):
+        # exact Gaussian integration of the cubic spline on each interval;
+        # partial moments I0..I3 [N0, N1-1] for standardised knots
+        # xBar[i, k] = (x1[k] - mu(x0[i])) / sigma and spline coefficients of
+        # the identity basis c [4, N1-1, N1] give the operator [N0, N1]
         sigma = np.sqrt(self.hwModel.varianceX(T0, T1))
-        V = CubicSpline(x1, np.array([max(U1[k], H1[k]) for k in range(U1.shape[0])]))
-        for i in range(x0.shape[0]):
-            mu = self.hwModel.expectationX(T0, x0[i], T1)
-            # we need to setup all the coefficients
-            xBar = np.array([(x - mu) / sigma for x in V.x])
-            Phi = np.array([norm.cdf(x) for x in xBar])
-            PhiPrime = np.array([norm.pdf(x) for x in xBar])
-            F0 = Phi
-            F1 = -1.0 * PhiPrime
-            F2 = Phi - xBar * PhiPrime
-            F3 = -1.0 * (xBar ** 2 + 2.0) * PhiPrime
-            dF0 = F0[1:] - F0[:-1]
-            dF1 = F1[1:] - F1[:-1]
-            dF2 = F2[1:] - F2[:-1]
-            dF3 = F3[1:] - F3[:-1]
-            I0 = dF0
-            I1 = sigma * dF1 - sigma * xBar[:-1] * I0
-            I2 = (
-                (sigma ** 2) * dF2
-                - 2 * sigma * xBar[:-1] * I1
-                - (sigma ** 2) * (xBar[:-1] ** 2) * I0
-            )
-            I3 = (
-                (sigma ** 3) * dF3
-                - 3 * sigma * xBar[:-1] * I2
-                - 3 * (sigma ** 2) * (xBar[:-1] ** 2) * I1
-                - (sigma ** 3) * (xBar[:-1] ** 3) * I0
-            )
-            # summing up
-            I = 0.0
-            for k in range(xBar.shape[0] - 1):
-                I += (
-                    V.c[3][k] * I0[k]
-                    + V.c[2][k] * I1[k]
-                    + V.c[1][k] * I2[k]
-                    + V.c[0][k] * I3[k]
-                )
-            V0[i] = self.hwModel.zeroBond(T0, x0[i], T1) * I
-        return [x0, V0]
+        mu = self.hwModel.expectationX(T0, x0, T1)
+        xBar = (x1[np.newaxis, :] - mu[:, np.newaxis]) / sigma
+        Phi = ndtr(xBar)
+        PhiPrime = np.exp(-0.5 * xBar * xBar) / np.sqrt(2.0 * np.pi)
+        F0 = Phi
+        F1 = -1.0 * PhiPrime
+        F2 = Phi - xBar * PhiPrime
+        F3 = -1.0 * (xBar ** 2 + 2.0) * PhiPrime
+        dF0 = F0[:, 1:] - F0[:, :-1]
+        dF1 = F1[:, 1:] - F1[:, :-1]
+        dF2 = F2[:, 1:] - F2[:, :-1]
+        dF3 = F3[:, 1:] - F3[:, :-1]
+        xBar = xBar[:, :-1]  # left knots
+        I0 = dF0
+        I1 = sigma * dF1 - sigma * xBar * I0
+        I2 = (sigma ** 2) * dF2 - 2 * sigma * xBar * I1 - (sigma ** 2) * (xBar ** 2) * I0
+        I3 = (
+            (sigma ** 3) * dF3
+            - 3 * sigma * xBar * I2
+            - 3 * (sigma ** 2) * (xBar ** 2) * I1
+            - (sigma ** 3) * (xBar ** 3) * I0
+        )
+        c = CubicSpline(x1, np.eye(x1.shape[0])).c
+        M = I0.dot(c[3]) + I1.dot(c[2]) + I2.dot(c[1]) + I3.dot(c[0])
+        zeroBonds = self.hwModel.zeroBond(T0, x0, T1)
+        return zeroBonds[:, np.newaxis] * M
@@ -1,37 +1,149 @@
 #!/usr/bin/python
 
-from scipy.stats import norm
-from scipy.optimize import brentq
+from scipy.special import erfcx, ndtr, ndtri
 import numpy as np
 
+# Pricing formulas broadcast over arrays of strikes, forwards, volatilities
+# and expiries; scalar inputs return scalars. Zero volatilities (nu < 1e-12)
+# are masked and priced by intrinsic value.
+
+
+def NormalPdf(x):
+    return np.exp(-0.5 * x * x) / np.sqrt(2.0 * np.pi)
+
 
 def BlackOverK(moneyness, stdDev, callOrPut):
     d1 = np.log(moneyness) / stdDev + stdDev / 2.0
     d2 = d1 - stdDev
-    return callOrPut * (moneyness * norm.cdf(callOrPut * d1) - norm.cdf(callOrPut * d2))
+    return callOrPut * (moneyness * ndtr(callOrPut * d1) - ndtr(callOrPut * d2))
 
 
 def Black(strike, forward, sigma, T, callOrPut):
-    nu = sigma * np.sqrt(T)
-    if nu < 1.0e-12:  # assume zero
-        return max(callOrPut * (forward - strike), 0.0)  # intrinsic value
-    return strike * BlackOverK(forward / strike, nu, callOrPut)
+    [strike, forward, nu, zero] = np.broadcast_arrays(
+        strike, forward, sigma * np.sqrt(T), sigma * np.sqrt(T) < 1.0e-12
+    )
+    intrinsic = np.maximum(callOrPut * (forward - strike), 0.0)
+    nu = np.where(zero, 1.0, nu)  # dummy value, overwritten by intrinsic value
+    value = np.where(
+        zero, intrinsic, strike * BlackOverK(forward / strike, nu, callOrPut)
+    )
+    return value[()]  # unwrap 0-d arrays
+
+
+def BlackD1(strike, forward, sigma, T):
+    nu = np.maximum(sigma * np.sqrt(T), 1.0e-12)
+    return [np.log(forward / strike) / nu + nu / 2.0, nu]
+
+
+def BlackDelta(strike, forward, sigma, T, callOrPut):
+    [d1, nu] = BlackD1(strike, forward, sigma, T)
+    intrinsic = np.where(callOrPut * (forward - strike) > 0.0, callOrPut, 0.0)
+    return np.where(nu > 1.0e-12, callOrPut * ndtr(callOrPut * d1), intrinsic)[()]
+
+
+def BlackGamma(strike, forward, sigma, T):
+    [d1, nu] = BlackD1(strike, forward, sigma, T)
+    return np.where(nu > 1.0e-12, NormalPdf(d1) / (forward * nu), 0.0)[()]
+
+
+def BlackVega(strike, forward, sigma, T):
+    [d1, nu] = BlackD1(strike, forward, sigma, T)
+    return forward * NormalPdf(d1) * np.sqrt(T)
+
+
+# Implied volatilities are solved for arrays of prices at once by Newton
+# iterations on normalised out-of-the-money prices, safeguarded by
+# bisection. Prices violating no-arbitrage bounds yield NaN, prices at
+# intrinsic value yield zero volatility.
+
+
+def SafeguardedNewton(objective, s, maxIterations=100, tolerance=1.0e-14):
+    # objective(s) returns [f, f / f'] for f increasing in s > 0; iterates
+    # leaving the bracket [lo, hi] are replaced by (geometric) bisection
+    lo = np.zeros(s.shape)
+    hi = np.full(s.shape, np.inf)
+    for k in range(maxIterations):
+        [f, step] = objective(s)
+        lo = np.where(f < 0.0, np.maximum(lo, s), lo)
+        hi = np.where(f > 0.0, np.minimum(hi, s), hi)
+        sNew = s - step
+        inside = (sNew > lo) & (sNew < hi)
+        bisection = np.where(np.isinf(hi), 2.0 * lo, 0.5 * (lo + hi))
+        sNew = np.where(inside, sNew, bisection)
+        converged = ~(np.abs(sNew - s) > tolerance * sNew)  # NaN counts as done
+        s = sNew
+        if np.all(converged):
+            break
+    return s
+
+
+def NormalisedBlack(x, s):
+    # out-of-the-money call price b = C / sqrt(FK) for x = ln(F/K) <= 0 and
+    # total volatility s, its distance bMax - b to the upper bound
+    # bMax = exp(x/2) and vega db/ds; erfcx avoids underflow for small b
+    d1 = x / s + s / 2.0
+    d2 = d1 - s
+    vega = np.exp(-0.5 * (x * x / (s * s) + s * s / 4.0)) / np.sqrt(2.0 * np.pi)
+    b = (
+        vega
+        * np.sqrt(np.pi / 2.0)
+        * (erfcx(-d1 / np.sqrt(2.0)) - erfcx(-d2 / np.sqrt(2.0)))
+    )
+    bMaxMinusB = np.exp(x / 2.0) * ndtr(-d1) + np.exp(-x / 2.0) * ndtr(d2)
+    return [b, bMaxMinusB, vega]
 
 
 def BlackImpliedVol(price, strike, forward, T, callOrPut):
-    def objective(sigma):
-        return Black(strike, forward, sigma, T, callOrPut) - price
-
-    return brentq(objective, 0.01, 1.00, xtol=1.0e-8)
+    [price, strike, forward, T, callOrPut] = np.broadcast_arrays(
+        *[np.asarray(a, dtype=float) for a in [price, strike, forward, T, callOrPut]]
+    )
+    with np.errstate(all="ignore"):
+        # normalised out-of-the-money price, an in-the-money option is turned
+        # into the out-of-the-money option of opposite type by subtracting its
+        # intrinsic value; a put is a call with x -> -x
+        intrinsic = np.maximum(callOrPut * (forward - strike), 0.0)
+        beta = (price - intrinsic) / np.sqrt(forward * strike)
+        x = -np.abs(np.log(forward / strike))
+        bMax = np.exp(x / 2.0)
+        # upper bound bMax sqrt(FK) = min(F, K), compared unnormalised
+        below = price - intrinsic < np.minimum(forward, strike)
+        valid = (beta > 0.0) & below & (T > 0.0)
+        beta = np.where(valid, beta, 0.5 * bMax)  # dummy values for the solver
+        # b(s) is convex below and concave above sc = sqrt(2|x|); for low
+        # prices we solve ln b(s) = ln beta, for high prices we solve
+        # ln(bMax - b(s)) = ln(bMax - beta) which is well-behaved for large s
+        sc = np.sqrt(-2.0 * x)
+        lower = (x < 0.0) & (beta < NormalisedBlack(x, sc)[0])
+
+        def objective(s):
+            [b, bMaxMinusB, vega] = NormalisedBlack(x, s)
+            fLower = np.log(b / beta)
+            fUpper = np.log((bMax - beta) / bMaxMinusB)
+            return [
+                np.where(lower, fLower, fUpper),
+                np.where(lower, fLower * b, fUpper * bMaxMinusB) / vega,
+            ]
+
+        # at-the-money b = 2 N(s/2) - 1 is inverted exactly
+        s = np.where(x < 0.0, sc, 2.0 * ndtri(0.5 * (1.0 + beta)))
+        s = SafeguardedNewton(objective, s)
+        sigma = np.where(valid, s / np.sqrt(T), np.nan)
+        sigma = np.where(price == intrinsic, 0.0, sigma)
+    return sigma[()]
 
 
 def BachelierRaw(moneyness, stdDev, callOrPut):
-    h = callOrPut * moneyness / stdDev
-    return stdDev * (h * norm.cdf(h) + norm.pdf(h))
+    zero = stdDev < 1.0e-12
+    h = callOrPut * moneyness / np.where(zero, 1.0, stdDev)
+    value = stdDev * (h * ndtr(h) + NormalPdf(h))
+    return np.where(zero, np.maximum(callOrPut * moneyness, 0.0), value)[()]
 
 
 def BachelierVegaRaw(moneyness, stdDev):
-    return norm.pdf(moneyness / stdDev)
+    zero = stdDev < 1.0e-12
+    h = moneyness / np.where(zero, 1.0, stdDev)
+    h = np.where(zero, np.where(moneyness == 0.0, 0.0, np.inf), h)
+    return NormalPdf(h)[()]
 
 
 def Bachelier(strike, forward, sigma, T, callOrPut):
@@ -42,8 +154,48 @@ def BachelierVega(strike, forward, sigma, T):
     return BachelierVegaRaw(forward - strike, sigma * np.sqrt(T)) * np.sqrt(T)
 
 
-def BachelierImpliedVol(price, strike, forward, T, callOrPut):
-    def objective(sigma):
-        return Bachelier(strike, forward, sigma, T, callOrPut) - price
+def BachelierDelta(strike, forward, sigma, T, callOrPut):
+    nu = sigma * np.sqrt(T)
+    zero = nu < 1.0e-12
+    h = callOrPut * (forward - strike) / np.where(zero, 1.0, nu)
+    intrinsic = np.where(callOrPut * (forward - strike) > 0.0, callOrPut, 0.0)
+    return np.where(zero, intrinsic, callOrPut * ndtr(h))[()]
+
+
+def BachelierGamma(strike, forward, sigma, T):
+    nu = sigma * np.sqrt(T)
+    zero = nu < 1.0e-12
+    h = (forward - strike) / np.where(zero, 1.0, nu)
+    return np.where(zero, 0.0, NormalPdf(h) / np.where(zero, 1.0, nu))[()]
+
 
-    return brentq(objective, 1e-4, 1e-1, xtol=1.0e-8)
+def BachelierImpliedVol(price, strike, forward, T, callOrPut):
+    [price, strike, forward, T, callOrPut] = np.broadcast_arrays(
+        *[np.asarray(a, dtype=float) for a in [price, strike, forward, T, callOrPut]]
+    )
+    with np.errstate(all="ignore"):
+        # out-of-the-money price p(s) = s (phi(h) + h N(h)) with h = -|F-K| / s
+        # is the price less intrinsic value, evaluated with Mills' ratio
+        # N(h) / phi(h) to avoid cancellation
+        moneyness = forward - strike
+        intrinsic = np.maximum(callOrPut * moneyness, 0.0)
+        otm = price - intrinsic
+        valid = (otm > 0.0) & (T > 0.0)
+        otm = np.where(valid, otm, 1.0)  # dummy values for the solver
+
+        def objective(s):
+            h = -np.abs(moneyness) / s
+            vega = NormalPdf(h)
+            p = s * vega * (1.0 + h * np.sqrt(np.pi / 2.0) * erfcx(-h / np.sqrt(2.0)))
+            f = np.log(p / otm)
+            return [f, f * p / vega]
+
+        # p(s) <= s / sqrt(2 pi) gives a start which is exact at-the-money; far
+        # out-of-the-money ln p(s) ~ -(F-K)^2 / (2 s^2) gives a better start
+        s = otm * np.sqrt(2.0 * np.pi)
+        farOtm = otm < np.abs(moneyness) * np.exp(-1.0)
+        sFarOtm = np.abs(moneyness) / np.sqrt(2.0 * np.log(np.abs(moneyness) / otm))
+        s = SafeguardedNewton(objective, np.where(farOtm, np.maximum(s, sFarOtm), s))
+        sigma = np.where(valid, s / np.sqrt(T), np.nan)
+        sigma = np.where(price == intrinsic, 0.0, sigma)
+    return sigma[()]
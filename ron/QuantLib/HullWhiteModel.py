@@ -11,8 +11,10 @@ class HullWhiteModel:
     def __init__(self, yieldCurve, meanReversion, volatilityTimes, volatilityValues):
         self.yieldCurve = yieldCurve
         self.meanReversion = meanReversion
-        self.volatilityTimes = volatilityTimes  # assume positive and ascending
-        self.volatilityValues = volatilityValues
+        self.volatilityTimes = np.asarray(
+            volatilityTimes, dtype=float
+        )  # assume positive and ascending
+        self.volatilityValues = np.asarray(volatilityValues, dtype=float)
         # pre-calculate y(t) on the time grid
         # y(t) = G'(s,t)^2 y(s) + sigma^2 [1 - exp{-2a(t-s)}] / (2a)
         t0 = 0.0
@@ -28,6 +30,13 @@ class HullWhiteModel:
             )
             t0 = self.volatilityTimes[i]
             y0 = self.y_[i]
+        # cache start time, y and (flat extrapolated) volatility of each
+        # piece; piece j covers (startTimes_[j], volatilityTimes[j]]
+        self.startTimes_ = np.concatenate([[0.0], self.volatilityTimes])
+        self.startY_ = np.concatenate([[0.0], self.y_])
+        self.sigmas_ = np.concatenate(
+            [self.volatilityValues, self.volatilityValues[-1:]]
+        )
 
     # auxilliary methods
 
@@ -37,34 +46,47 @@ class HullWhiteModel:
     def GPrime(self, t, T):
         return np.exp(-self.meanReversion * (T - t))
 
+    def pieceIndex(self, t):
+        # find idx s.t. t[idx-1] < t <= t[idx], t may be a float or np.array
+        return np.searchsorted(self.volatilityTimes, t, side="left")
+
     def y(self, t):
-        # find idx s.t. t[idx] < t < t[idx+1]
-        idxSet = np.where(self.volatilityTimes < t)[0]
-        idx = -1 if (idxSet.shape[0] == 0) else idxSet[-1]
-        t0 = 0.0 if (idxSet.shape[0] == 0) else self.volatilityTimes[idx]
-        y0 = 0.0 if (idxSet.shape[0] == 0) else self.y_[idx]
-        s1 = self.volatilityValues[
-            min(idx + 1, len(self.volatilityValues) - 1)
-        ]  # flat extrapolation
+        idx = self.pieceIndex(t)
+        t0 = self.startTimes_[idx]
+        y0 = self.startY_[idx]
+        s1 = self.sigmas_[idx]  # flat extrapolation
         y1 = (self.GPrime(t0, t) ** 2) * y0 + s1 ** 2 * (
             1.0 - np.exp(-2 * self.meanReversion * (t - t0))
         ) / (2.0 * self.meanReversion)
         return y1
 
+    def integralGPrimeY(self, t, T):
+        # \int_t^T G'(u,T)y(u)du exact for piecewise constant volatility,
+        # on a piece starting at tau with y(tau) = y0 and volatility s we have
+        # y(u) = G'(tau,u)^2 y0 + s^2 [1 - G'(tau,u)^2] / (2a)
+        a = self.meanReversion
+        i0 = np.searchsorted(self.volatilityTimes, t, side="right")
+        i1 = np.searchsorted(self.volatilityTimes, T, side="left")
+        integral = 0.0
+        u1 = t
+        for idx in range(i0, i1 + 1):  # pieces overlapping [t, T]
+            u2 = self.volatilityTimes[idx] if idx < i1 else T
+            tau = self.startTimes_[idx]
+            s2 = self.sigmas_[idx] ** 2
+            K1 = np.exp(-a * (T - u1) - 2 * a * (u1 - tau))
+            K2 = np.exp(-a * (T - u2) - 2 * a * (u2 - tau))
+            integral += (self.startY_[idx] - s2 / 2.0 / a) / a * (K1 - K2) + (
+                s2 / 2.0 / a / a * (self.GPrime(u2, T) - self.GPrime(u1, T))
+            )
+            u1 = u2
+        return integral
+
     def riskNeutralExpectationX(self, t, xt, T):
         # E[x] = G'(t,T)x + \int_t^T G'(u,T)y(u)du
-        def f(u):
-            return self.GPrime(u, T) * self.y(u)
-
-        # use Simpson's rule to approximate integral, this should better be solved analytically
-        integral = (T - t) / 6 * (f(t) + 4 * f((t + T) / 2) + f(T))
-        return self.GPrime(t, T) * xt + integral
+        return self.GPrime(t, T) * xt + self.integralGPrimeY(t, T)
 
-    def sigma(self, t):  # Todo test this method
-        # find idx s.t. t[idx] < t < t[idx+1]
-        idxSet = np.where(self.volatilityTimes < t)[0]
-        idx = -1 if (idxSet.shape[0] == 0) else idxSet[-1]
-        return self.volatilityValues[min(idx + 1, len(self.volatilityValues) - 1)]
+    def sigma(self, t):
+        return self.sigmas_[self.pieceIndex(t)]
 
     # model methods
 
@@ -130,6 +152,28 @@ class HullWhiteModel:
     def numeraire(self, X):
         return np.exp(X[1])
 
+    # batch versions for X as np.array [nPaths, size]
+
+    def zeroBondPayoffBatch(self, X, t, T):
+        return self.zeroBond(t, X[:, 0], T)
+
+    def numeraireBatch(self, X):
+        return np.exp(X[:, 1])
+
+    # zero bonds P(t,T_i) = A_i exp{-G_i x} for many pay times T_i; the
+    # deterministic coefficients [A, G] only depend on t and T_i and are
+    # calculated once, P(t,T_i) for all states is then a matrix exponential
+
+    def zeroBondCoefficients(self, t, payTimes):
+        G = self.G(t, np.array(payTimes))
+        df = np.array([self.yieldCurve.discount(T) for T in payTimes])
+        A = df / self.yieldCurve.discount(t) * np.exp(-0.5 * G ** 2 * self.y(t))
+        return [A, G]
+
+    def zeroBondPayoffMatrix(self, X, coefficients):  # [nPaths, nPayTimes]
+        [A, G] = coefficients
+        return A * np.exp(-np.outer(X[:, 0], G))
+
     # evolve X(t0) -> X(t0+dt) using independent Brownian increments dW
     # t0, dt are assumed float, X0, X1, dW are np.array
     def evolve(self, t0, X0, dt, dW):
@@ -144,6 +188,43 @@ class HullWhiteModel:
         # gather results
         return np.array([x1, s1])
 
+    # evolve a batch of paths X(t0) -> X(t0+dt) in one go
+    # X0 is np.array [nPaths, size] and dW is np.array [nPaths, factors],
+    # path-independent quantities are only calculated once per step
+    def evolveBatch(self, t0, X0, dt, dW):
+        x1 = self.riskNeutralExpectationX(t0, X0[:, 0], t0 + dt)
+        nu = np.sqrt(self.varianceX(t0, t0 + dt))
+        x1 = x1 + nu * dW[:, 0]
+        # s1 = s0 + \int_t0^t0+dt r dt via Trapezoidal rule
+        r0 = self.yieldCurve.forwardRate(t0) + X0[:, 0]
+        r1 = self.yieldCurve.forwardRate(t0 + dt) + x1
+        s1 = X0[:, 1] + (r0 + r1) * dt / 2
+        # gather results
+        return np.stack([x1, s1], axis=1)
+
+    # path-independent coefficients for each step of a simulation time grid,
+    # rows [G'(t0,t1), \int_t0^t1 G'(u,t1)y(u)du, nu, f(0,t0), f(0,t1), dt]
+    def prepare(self, times):
+        coefficients = np.zeros([len(times) - 1, 6])
+        for j in range(len(times) - 1):
+            t0, t1 = times[j], times[j + 1]
+            coefficients[j] = [
+                self.GPrime(t0, t1),
+                self.integralGPrimeY(t0, t1),
+                np.sqrt(self.varianceX(t0, t1)),
+                self.yieldCurve.forwardRate(t0),
+                self.yieldCurve.forwardRate(t1),
+                t1 - t0,
+            ]
+        return coefficients
+
+    # evolve a batch of paths with a row of coefficients from prepare(times)
+    def evolvePrepared(self, coefficients, X0, dW):
+        [GPrime, integral, nu, f0, f1, dt] = coefficients
+        x1 = GPrime * X0[:, 0] + integral + nu * dW[:, 0]
+        s1 = X0[:, 1] + (f0 + X0[:, 0] + f1 + x1) * dt / 2
+        return np.stack([x1, s1], axis=1)
+
 
 class HullWhiteModelWithDiscreteNumeraire(HullWhiteModel):
 
@@ -163,3 +244,109 @@ class HullWhiteModelWithDiscreteNumeraire(HullWhiteModel):
         x1 = x1 + nu * dW[0]
         s1 = X0[1] + np.log(1.0 / self.zeroBond(t0, X0[0], t0 + dt))
         return np.array([x1, s1])
+
+    # batch version of evolve, X0 is np.array [nPaths, size] and
+    # dW is np.array [nPaths, factors]
+    def evolveBatch(self, t0, X0, dt, dW):
+        x1 = self.expectationX(t0, X0[:, 0], t0 + dt)
+        nu = np.sqrt(self.varianceX(t0, t0 + dt))
+        x1 = x1 + nu * dW[:, 0]
+        s1 = X0[:, 1] + np.log(1.0 / self.zeroBond(t0, X0[:, 0], t0 + dt))
+        return np.stack([x1, s1], axis=1)
+
+    # path-independent coefficients for each step of a simulation time grid,
+    # rows [G'(t0,t1), G(t0,t1), y(t0), nu, log P(0,t0)/P(0,t1)]
+    def prepare(self, times):
+        coefficients = np.zeros([len(times) - 1, 5])
+        for j in range(len(times) - 1):
+            t0, t1 = times[j], times[j + 1]
+            coefficients[j] = [
+                self.GPrime(t0, t1),
+                self.G(t0, t1),
+                self.y(t0),
+                np.sqrt(self.varianceX(t0, t1)),
+                np.log(self.yieldCurve.discount(t0) / self.yieldCurve.discount(t1)),
+            ]
+        return coefficients
+
+    # evolve a batch of paths with a row of coefficients from prepare(times)
+    def evolvePrepared(self, coefficients, X0, dW):
+        [GPrime, G, y, nu, logDiscount] = coefficients
+        x1 = GPrime * (X0[:, 0] + G * y) + nu * dW[:, 0]
+        s1 = X0[:, 1] + logDiscount + G * X0[:, 0] + 0.5 * G ** 2 * y
+        return np.stack([x1, s1], axis=1)
+
+
+class HullWhiteModelWithExactNumeraire(HullWhiteModel):
+    # x(T) and I = \int_t^T x(u)du are jointly Gaussian given x(t), we sample
+    # both exactly from their bivariate transition; the bank account state
+    # s = \int_0^t r du is then exact for arbitrary step sizes and
+    # E[exp{-(s(T)-s(t))}] reproduces the zero bond P(t,T)
+
+    # Python constructor
+    def __init__(self, yieldCurve, meanReversion, volatilityTimes, volatilityValues):
+        HullWhiteModel.__init__(
+            self, yieldCurve, meanReversion, volatilityTimes, volatilityValues
+        )
+
+    def factors(self):  # dimension of W(t), we need two normals per step
+        return 2
+
+    def integratedCovariance(self, t, T):
+        # [Var x(T), Cov(x(T), I), Var I] conditional on x(t), based on
+        # J_k = \int_t^T sigma(u)^2 G'(u,T)^k du for piecewise constant sigma
+        a = self.meanReversion
+        i0 = np.searchsorted(self.volatilityTimes, t, side="right")
+        i1 = np.searchsorted(self.volatilityTimes, T, side="left")
+        J = np.zeros(3)
+        u1 = t
+        for idx in range(i0, i1 + 1):  # pieces overlapping [t, T]
+            u2 = self.volatilityTimes[idx] if idx < i1 else T
+            s2 = self.sigmas_[idx] ** 2
+            J[0] += s2 * (u2 - u1)
+            for k in [1, 2]:
+                Gk = self.GPrime(u2, T) ** k - self.GPrime(u1, T) ** k
+                J[k] += s2 * Gk / k / a
+            u1 = u2
+        return [J[2], (J[1] - J[2]) / a, (J[0] - 2 * J[1] + J[2]) / a / a]
+
+    # path-independent coefficients for a step [t0, t1], rows
+    # [G'(t0,t1), \int G'y du, std x, beta, std I|x, G(t0,t1), mu, log P0/P1]
+    # with x1 = G'x0 + \int G'y du + std x Z1,
+    # I = G x0 + mu + beta (x1 - E[x1]) + std I|x Z2
+    def stepCoefficients(self, t0, t1):
+        [varX, covXI, varI] = self.integratedCovariance(t0, t1)
+        G = self.G(t0, t1)
+        beta = covXI / varX if varX > 0.0 else 0.0
+        return [
+            self.GPrime(t0, t1),
+            self.integralGPrimeY(t0, t1),
+            np.sqrt(varX),
+            beta,
+            np.sqrt(max(varI - beta * covXI, 0.0)),
+            G,
+            0.5 * G ** 2 * self.y(t0) + 0.5 * varI,
+            np.log(self.yieldCurve.discount(t0) / self.yieldCurve.discount(t1)),
+        ]
+
+    def prepare(self, times):
+        return np.array(
+            [
+                self.stepCoefficients(times[j], times[j + 1])
+                for j in range(len(times) - 1)
+            ]
+        )
+
+    def evolvePrepared(self, coefficients, X0, dW):
+        [GPrime, integral, stdX, beta, stdI, G, mu, logDiscount] = coefficients
+        dX = stdX * dW[:, 0]
+        x1 = GPrime * X0[:, 0] + integral + dX
+        I = G * X0[:, 0] + mu + beta * dX + stdI * dW[:, 1]
+        s1 = X0[:, 1] + logDiscount + I
+        return np.stack([x1, s1], axis=1)
+
+    def evolveBatch(self, t0, X0, dt, dW):
+        return self.evolvePrepared(self.stepCoefficients(t0, t0 + dt), X0, dW)
+
+    def evolve(self, t0, X0, dt, dW):
+        return self.evolveBatch(t0, np.array([X0]), dt, np.array([dW]))[0]
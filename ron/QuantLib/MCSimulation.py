@@ -1,50 +1,425 @@
 #!/usr/bin/python
 
+import multiprocessing
+import time
+from collections import deque
+
 import numpy as np
 
+from RandomNumbers import PseudoRandomNumbers, AntitheticNumbers
+
+
+# Monte Carlo estimate and standard error from simulated discounted payoffs
+# V0 [nPaths]. Optional control variates are given as list of [C0, exactPrice]
+# with simulated discounted control payoffs C0 [nPaths]; the optimal control
+# weights are estimated by regression on the same paths. For antithetic paths
+# the standard error is calculated from the averages of path pairs. For quasi
+# random paths, consecutive blocks of replicationSize paths with independent
+# scramblings are the replications and the standard error is calculated from
+# the block averages.
+def mcEstimate(V0, controls=None, antithetic=False, replicationSize=None):
+    Y = V0
+    if controls is not None and len(controls) > 0:
+        C = np.array([control[0] for control in controls]).T
+        exact = np.array([control[1] for control in controls])
+        dC = C - np.mean(C, axis=0)
+        beta = np.linalg.lstsq(dC, V0 - np.mean(V0), rcond=None)[0]
+        Y = V0 - (C - exact).dot(beta)
+    npv = np.mean(Y)
+    if replicationSize is not None:
+        starts = np.arange(0, Y.shape[0], replicationSize)
+        Y = np.add.reduceat(Y, starts) / np.diff(np.append(starts, Y.shape[0]))
+    elif antithetic:
+        Y = Y[: 2 * (Y.shape[0] // 2)].reshape([-1, 2]).mean(axis=1)
+    stdErr = np.std(Y, ddof=1) / np.sqrt(Y.shape[0]) if Y.shape[0] > 1 else np.nan
+    return [npv, stdErr]
+
+
+# discounted payoffs N(0) V(T) / N(T) for states x0, xObs and xPay
+# [nPaths, size] at 0, observation time and pay time; payoff and numeraire
+# are evaluated for all paths at once if they provide batch methods
+def discountPayoffs(payoff, x0, xObs, xPay):
+    if hasattr(payoff, "atBatch") and hasattr(payoff.model, "numeraireBatch"):
+        VT = payoff.atBatch(xObs)
+        N0 = payoff.model.numeraireBatch(x0)
+        NT = payoff.model.numeraireBatch(xPay)
+    else:  # fall-back to path-wise evaluation
+        VT = np.array([payoff.at(x) for x in xObs])
+        N0 = np.array([payoff.model.numeraire(x) for x in x0])  # should be 1
+        NT = np.array([payoff.model.numeraire(x) for x in xPay])
+    return N0 * VT / NT
+
+
+# evolution method used for model: "prepared" (prepare and evolvePrepared),
+# "batch" (evolveBatch) or "pathwise" (evolve). A specialised method is only
+# used if its class is the class, or a subclass of the class, implementing
+# the more general methods; otherwise a subclass overriding only evolve or
+# evolveBatch would silently be ignored.
+def evolutionMethod(model):
+    def definingClass(name):
+        return next((c for c in type(model).__mro__ if name in vars(c)), None)
+
+    def specialises(names, generalNames):
+        classes = [definingClass(name) for name in names]
+        general = [definingClass(name) for name in generalNames]
+        return all(c is not None for c in classes) and all(
+            issubclass(c, g) for c in classes for g in general if g is not None
+        )
+
+    if specialises(["prepare", "evolvePrepared"], ["evolve", "evolveBatch"]):
+        return "prepared"
+    if specialises(["evolveBatch"], ["evolve"]):
+        return "batch"
+    return "pathwise"
+
 
 class MCSimulation:
 
     # Python constructor
-    def __init__(self, model, times, nPaths, seed=123):
+    def __init__(
+        self,
+        model,
+        times,
+        nPaths,
+        seed=123,
+        nWorkers=None,
+        blockSize=10000,
+        randomNumbers=None,
+        antithetic=False,
+    ):
         print("Start MC Simulation:", end="", flush=True)
         self.model = model  # an object implementing stochastic process interface
         self.times = times  # simulation times [0, ..., T], np.array
         self.nPaths = nPaths  # number of paths, long
+        # random number source, e.g. PseudoRandomNumbers or SobolBrownianBridge
+        self.randomNumbers = (
+            PseudoRandomNumbers(seed) if randomNumbers is None else randomNumbers
+        )
+        if antithetic:
+            self.randomNumbers = AntitheticNumbers(self.randomNumbers)
+        # quasi random blocks of the parallel simulation are independently
+        # scrambled replications, a single stream gives no error estimate
+        self.quasiRandom = getattr(self.randomNumbers, "quasiRandom", False)
+        self.replicationSize = None
+        if self.quasiRandom and nWorkers is not None:
+            self.replicationSize = blockSize
+        if nWorkers is not None:
+            # parallel simulation with independent random streams per block
+            # of paths; results do not depend on the number of workers
+            print(" |parallel", end="", flush=True)
+            simulation = MCStreamingSimulation(
+                model,
+                times,
+                nPaths,
+                seed,
+                None,
+                blockSize,
+                nWorkers,
+                self.randomNumbers,
+            )
+            self.dW = None  # increments are not kept in parallel mode
+            self.X = np.concatenate(list(simulation.blocks()))
+            print("| Finished.", end="\n", flush=True)
+            return
         # random number generator
         print(" |dW's", end="", flush=True)
-        self.dW = np.random.RandomState(seed).standard_normal(
-            [self.nPaths, len(self.times) - 1, model.factors()]
+        self.randomNumbers.restart()
+        self.dW = self.randomNumbers.standardNormals(
+            self.nPaths, self.times, model.factors()
         )
         print("|", end="", flush=True)
         # simulate states
         self.X = np.zeros([self.nPaths, len(self.times), model.size()])
-        for i in range(self.nPaths):
-            if i % max(int(self.nPaths / 10), 1) == 0:
-                print("s", end="", flush=True)
-            self.X[i][0] = self.model.initialValues()
+        method = evolutionMethod(self.model)
+        if method == "prepared":
+            # path-independent coefficients are calculated once per step
+            coefficients = self.model.prepare(self.times)
+            self.X[:, 0] = self.model.initialValues()
+            for j in range(len(self.times) - 1):
+                if j % max(int((len(self.times) - 1) / 10), 1) == 0:
+                    print("s", end="", flush=True)
+                self.X[:, j + 1] = self.model.evolvePrepared(
+                    coefficients[j], self.X[:, j], self.dW[:, j]
+                )
+        elif method == "batch":
+            # advance all paths per time step with array operations
+            self.X[:, 0] = self.model.initialValues()
             for j in range(len(self.times) - 1):
-                self.X[i][j + 1] = model.evolve(
-                    self.times[j], self.X[i][j], times[j + 1] - times[j], self.dW[i][j]
+                if j % max(int((len(self.times) - 1) / 10), 1) == 0:
+                    print("s", end="", flush=True)
+                self.X[:, j + 1] = self.model.evolveBatch(
+                    self.times[j], self.X[:, j], times[j + 1] - times[j], self.dW[:, j]
                 )
+        else:  # fall-back to path-wise evolution
+            for i in range(self.nPaths):
+                if i % max(int(self.nPaths / 10), 1) == 0:
+                    print("s", end="", flush=True)
+                self.X[i][0] = self.model.initialValues()
+                for j in range(len(self.times) - 1):
+                    self.X[i][j + 1] = model.evolve(
+                        self.times[j],
+                        self.X[i][j],
+                        times[j + 1] - times[j],
+                        self.dW[i][j],
+                    )
         print("| Finished.", end="\n", flush=True)
 
-    def npv(self, payoff):
-        print("Calculate payoff...", end="", flush=True)
+    def discountedPayoffs(self, payoff):
         obsIdx = np.where(self.times == payoff.observationTime)[0][
             0
         ]  # assume we simulated these dates
         payIdx = np.where(self.times == payoff.payTime)[0][
             0
         ]  # otherwise we get an exception
-        V0 = np.zeros([self.nPaths])  # simulated discounted payoffs
-        VT = np.zeros([self.nPaths])  # simulated payoff at observation time
-        N0 = np.zeros([self.nPaths])  # numeraire at 0; should be 1
-        NT = np.zeros([self.nPaths])  # simulated numeraire at pay time
-        for i in range(self.nPaths):
-            VT[i] = payoff.at(self.X[i][obsIdx])
-            N0[i] = payoff.model.numeraire(self.X[i][0])
-            NT[i] = payoff.model.numeraire(self.X[i][payIdx])
-            V0[i] = N0[i] * VT[i] / NT[i]
+        V0 = discountPayoffs(payoff, self.X[:, 0], self.X[:, obsIdx], self.X[:, payIdx])
+        return V0
+
+    # controls is an optional list of [payoff, exactPrice] control variates,
+    # with fullOutput we return [npv, standard error]
+    def npv(self, payoff, controls=None, fullOutput=False):
+        print("Calculate payoff...", end="", flush=True)
+        V0 = self.discountedPayoffs(payoff)
+        C0 = [
+            [self.discountedPayoffs(control[0]), control[1]]
+            for control in (controls if controls is not None else [])
+        ]
+        [npv, stdErr] = mcEstimate(
+            V0,
+            C0,
+            isinstance(self.randomNumbers, AntitheticNumbers),
+            self.replicationSize,
+        )
         print(" Done.", end="\n", flush=True)
-        return np.mean(V0)
+        if self.quasiRandom and self.replicationSize is None:
+            stdErr = np.nan  # paths of a single quasi random stream are not iid
+            if fullOutput:
+                print(
+                    "WARNING: no standard error for quasi random numbers, use nWorkers."
+                )
+        return npv if not fullOutput else [npv, stdErr]
+
+
+class RunningStatistics:
+    # running mean and variance via Welford's algorithm, samples are added in
+    # batches and merged with the pairwise update of Chan et al.
+
+    # Python constructor
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.M2 = 0.0  # sum of squared deviations from the mean
+
+    def add(self, samples):
+        n = samples.shape[0]
+        if n == 0:
+            return
+        mean = np.mean(samples)
+        M2 = np.sum((samples - mean) ** 2)
+        delta = mean - self.mean
+        total = self.count + n
+        self.mean += delta * n / total
+        self.M2 += M2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    def variance(self):
+        return self.M2 / (self.count - 1) if self.count > 1 else np.nan
+
+    def stdError(self):
+        return np.sqrt(self.variance() / self.count) if self.count > 1 else np.nan
+
+
+# Simulation and payoff for forked worker processes. QuantLib objects can
+# not be pickled, hence workers inherit them from the parent process.
+_workerState = {}
+
+
+def _runBlock(blockIdx):
+    simulation = _workerState["simulation"]
+    payoff = _workerState["payoff"]
+    X = simulation.simulateBlock(simulation.brownianIncrements(blockIdx))
+    if payoff is None:
+        return X
+    return simulation.discount(payoff, X)
+
+
+class MCStreamingSimulation:
+    # Monte Carlo simulation with bounded memory. Paths are simulated in
+    # blocks of blockSize paths; only the states at observationTimes are kept
+    # and each block is discarded after its results are passed on.
+    # For nWorkers=None the paths coincide with those of MCSimulation for the
+    # same random numbers. Otherwise, each block uses its own random stream
+    # derived via SeedSequence(seed).spawn and blocks are distributed over
+    # nWorkers processes. Results are assembled in block order and are
+    # identical for any number of workers.
+
+    # Python constructor
+    def __init__(
+        self,
+        model,
+        times,
+        nPaths,
+        seed=123,
+        observationTimes=None,
+        blockSize=10000,
+        nWorkers=None,
+        randomNumbers=None,
+    ):
+        self.model = model  # an object implementing stochastic process interface
+        self.times = times  # simulation times [0, ..., T], np.array
+        self.nPaths = nPaths  # number of paths, long
+        self.seed = seed
+        self.blockSize = blockSize  # max. number of paths held in memory
+        self.nWorkers = nWorkers  # None for a single random stream
+        # random number source, e.g. PseudoRandomNumbers or SobolBrownianBridge
+        self.randomNumbers = (
+            PseudoRandomNumbers(seed) if randomNumbers is None else randomNumbers
+        )
+        # antithetic pairs (2i, 2i+1) must not straddle blocks, otherwise the
+        # pairing of concatenated blocks does not match the global pairing
+        assert not isinstance(self.randomNumbers, AntitheticNumbers) or (
+            blockSize % 2 == 0
+        ), "antithetic paths require an even blockSize"
+        # states are only stored at observation times, default all times
+        self.observationTimes = (
+            np.array(times) if observationTimes is None else np.array(observationTimes)
+        )
+        self.obsIdx = np.array(
+            [self.getIndexWithTolerance(self.times, t) for t in self.observationTimes]
+        )
+        # path-independent coefficients per time step, if supported by model
+        self.method = evolutionMethod(self.model)
+        self.coefficients = (
+            self.model.prepare(self.times) if self.method == "prepared" else None
+        )
+
+    @staticmethod
+    def getIndexWithTolerance(times, t):
+        return np.where(abs(times - t) < 1.0e-8)[0][0]  # we need to simulate t
+
+    def simulateBlock(self, dW):
+        # evolve a block of paths and keep states at observation times only
+        # dW is np.array [nBlockPaths, nSteps, factors]
+        X = np.zeros([dW.shape[0], self.observationTimes.shape[0], self.model.size()])
+        x = np.tile(self.model.initialValues(), [dW.shape[0], 1])
+        for k in np.where(self.obsIdx == 0)[0]:
+            X[:, k] = x
+        for j in range(len(self.times) - 1):
+            dt = self.times[j + 1] - self.times[j]
+            if self.coefficients is not None:
+                x = self.model.evolvePrepared(self.coefficients[j], x, dW[:, j])
+            elif self.method == "batch":
+                x = self.model.evolveBatch(self.times[j], x, dt, dW[:, j])
+            else:  # fall-back to path-wise evolution
+                x = np.array(
+                    [
+                        self.model.evolve(self.times[j], x[i], dt, dW[i][j])
+                        for i in range(x.shape[0])
+                    ]
+                )
+            for k in np.where(self.obsIdx == j + 1)[0]:
+                X[:, k] = x
+            if j + 1 >= np.max(self.obsIdx):  # no need to evolve further
+                break
+        return X
+
+    def nBlocks(self):
+        return (self.nPaths + self.blockSize - 1) // self.blockSize
+
+    def brownianIncrements(self, blockIdx):
+        # independent and reproducible random stream for each block
+        n = min(self.blockSize, self.nPaths - blockIdx * self.blockSize)
+        return self.randomNumbers.blockStandardNormals(
+            blockIdx, n, self.times, self.model.factors()
+        )
+
+    def mapBlocks(self, payoff=None):
+        # generator yielding simulated states (payoff=None) or discounted
+        # payoffs per block in block order, blocks are distributed to workers.
+        # At most 2 * nWorkers blocks are in flight, further blocks are only
+        # submitted as results are consumed; closing the generator early
+        # terminates the pool and no further blocks are simulated
+        methods = multiprocessing.get_all_start_methods()
+        if self.nWorkers == 1 or self.nBlocks() == 1 or "fork" not in methods:
+            for blockIdx in range(self.nBlocks()):
+                X = self.simulateBlock(self.brownianIncrements(blockIdx))
+                yield X if payoff is None else self.discount(payoff, X)
+            return
+        _workerState.update(simulation=self, payoff=payoff)
+        context = multiprocessing.get_context("fork")
+        nWorkers = min(self.nWorkers, self.nBlocks())
+        with context.Pool(nWorkers) as pool:  # terminated on exit
+            pending = deque()
+            nextIdx = 0
+            while nextIdx < self.nBlocks() or len(pending) > 0:
+                while nextIdx < self.nBlocks() and len(pending) < 2 * nWorkers:
+                    pending.append(pool.apply_async(_runBlock, (nextIdx,)))
+                    nextIdx += 1
+                yield pending.popleft().get()
+
+    def blocks(self):
+        # generator yielding simulated states [nBlockPaths, nObservations, size]
+        if self.nWorkers is not None:
+            yield from self.mapBlocks()
+            return
+        self.randomNumbers.restart()
+        for start in range(0, self.nPaths, self.blockSize):
+            n = min(self.blockSize, self.nPaths - start)
+            dW = self.randomNumbers.standardNormals(n, self.times, self.model.factors())
+            yield self.simulateBlock(dW)
+
+    def discount(self, payoff, X):
+        # discounted payoffs for simulated states X [nPaths, nObservations, size]
+        obsIdx = self.getIndexWithTolerance(
+            self.observationTimes, payoff.observationTime
+        )
+        payIdx = self.getIndexWithTolerance(self.observationTimes, payoff.payTime)
+        x0 = np.tile(self.model.initialValues(), [X.shape[0], 1])
+        return discountPayoffs(payoff, x0, X[:, obsIdx], X[:, payIdx])
+
+    def discountedPayoffs(self, payoff):
+        # generator yielding simulated discounted payoffs block by block
+        if self.nWorkers is not None:
+            yield from self.mapBlocks(payoff)
+            return
+        for X in self.blocks():
+            yield self.discount(payoff, X)
+
+    def npv(self, payoff):
+        sumV0 = 0.0
+        for V0 in self.discountedPayoffs(payoff):
+            sumV0 += np.sum(V0)
+        return sumV0 / self.nPaths
+
+    # simulate blocks of paths until the standard error of the npv is below
+    # targetStdError, the timeBudget (in seconds) is used up or all nPaths
+    # are simulated; returns [npv, standard error, number of paths used].
+    # For quasi random numbers the standard error is estimated from the means
+    # of independently scrambled blocks (nWorkers is not None)
+    def adaptiveNpv(self, payoff, targetStdError=None, timeBudget=None):
+        antithetic = isinstance(self.randomNumbers, AntitheticNumbers)
+        quasiRandom = getattr(self.randomNumbers, "quasiRandom", False)
+        if quasiRandom and self.nWorkers is None:
+            print("WARNING: no standard error for quasi random numbers, use nWorkers.")
+        startTime = time.perf_counter()
+        stats = RunningStatistics()
+        sumV0 = 0.0
+        nPaths = 0
+        blocks = self.discountedPayoffs(payoff)
+        for V0 in blocks:
+            if antithetic:  # pair averages are independent samples
+                V0 = V0[: 2 * (V0.shape[0] // 2)].reshape([-1, 2]).mean(axis=1)
+                nPaths += 2 * V0.shape[0]  # an unpaired last path is not used
+                sumV0 += 2 * np.sum(V0)
+            else:
+                nPaths += V0.shape[0]
+                sumV0 += np.sum(V0)
+            if not quasiRandom:
+                stats.add(V0)
+            elif self.nWorkers is not None:  # one sample per scrambling
+                stats.add(np.array([np.mean(V0)]))
+            if targetStdError is not None and stats.stdError() <= targetStdError:
+                break
+            if timeBudget is not None and time.perf_counter() - startTime > timeBudget:
+                break
+        blocks.close()  # stop simulating blocks which are not needed
+        return [sumV0 / nPaths, stats.stdError(), nPaths]
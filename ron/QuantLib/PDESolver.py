@@ -1,7 +1,6 @@
 #!/usr/bin/python
 
 import numpy as np
-from scipy.sparse import diags
 
 from ThetaMethod import thetaStep
 
@@ -31,9 +30,10 @@ class PDESolver:
             -self.stdDevs * sigma, self.stdDevs * sigma, self.nGridPoints
         )
 
+    # U1, H1 may be [n] or [n, nTrades] for a portfolio
     def rollBack(self, T0, T1, x1, U1, H1):
         # first we calculate the payoff
-        V = np.array([max(U1[k], H1[k]) for k in range(U1.shape[0])])
+        V = np.maximum(U1, H1)
         # now we need to determine the time grid
         M = int((T1 - T0) / self.timeStepSize)
         tGrid = np.linspace(T1, T1 - M * self.timeStepSize, M + 1)
@@ -63,15 +63,21 @@ class PDESolver:
         if self.lambda0N != None:  # fall-back if provided by user, typically lambda0N=0
             lambda0 = self.lambda0N
             lambdaN = self.lambda0N
-        else:
+        else:  # lambdas are arrays over trades for a portfolio
             Vx0 = (V[2] - V[0]) / 2.0 / hx
             Vxx0 = (V[2] - 2 * V[1] + V[0]) / hx / hx
-            lambda0 = Vxx0 / Vx0 if abs(Vx0) > 1.0e-8 else 0.0
+            Vx0Safe = np.where(abs(Vx0) > 1.0e-8, Vx0, 1.0)
+            lambda0 = np.where(abs(Vx0) > 1.0e-8, Vxx0 / Vx0Safe, 0.0)
             VxN = (V[-1] - V[-3]) / 2.0 / hx
             VxxN = (V[-1] - 2 * V[-2] + V[-3]) / hx / hx
-            lambdaN = VxxN / VxN if abs(VxN) > 1.0e-8 else 0.0
+            VxNSafe = np.where(abs(VxN) > 1.0e-8, VxN, 1.0)
+            lambdaN = np.where(abs(VxN) > 1.0e-8, VxxN / VxNSafe, 0.0)
             # print('Vx0 = '+str('%10.6f'%Vx0)+', Vxx0 = '+str('%10.6f'%Vxx0)+', l0 = '+str('%10.6f'%lambda0)+ \
             #    ', VxN = '+str('%10.6f'%VxN)+', VxxN = '+str('%10.6f'%VxxN)+', lN = '+str('%10.6f'%lambdaN)  )
+        if len(np.shape(lambda0)) > 0:  # boundary rows differ per trade
+            [c, l, u] = [
+                np.repeat(d[:, np.newaxis], V.shape[1], axis=1) for d in [c, l, u]
+            ]
         c[0] = (
             2.0
             * (y - a * x[0] + lambda0 * sigma ** 2 / 2.0)
@@ -15,16 +15,25 @@ class Pay:
     def at(self, x):
         return self.payoff.at(x)
 
+    def atBatch(self, X):
+        return self.payoff.atBatch(X)
+
 
 class Zero:
     def at(self, x):
         return 0.0
 
+    def atBatch(self, X):
+        return np.zeros(X.shape[0])
+
 
 class One:
     def at(self, x):
         return 1.0
 
+    def atBatch(self, X):
+        return np.ones(X.shape[0])
+
 
 class Max:
     # Python constructor
@@ -35,6 +44,9 @@ class Max:
     def at(self, x):
         return max(self.first.at(x), self.second.at(x),)
 
+    def atBatch(self, X):
+        return np.maximum(self.first.atBatch(X), self.second.atBatch(X))
+
 
 class VanillaOption:
     # Python constructor
@@ -49,6 +61,11 @@ class VanillaOption:
     def at(self, x):
         return max(self.callOrPut * (self.underlying.at(x) - self.strike), 0.0)
 
+    def atBatch(self, X):
+        return np.maximum(
+            self.callOrPut * (self.underlying.atBatch(X) - self.strike), 0.0
+        )
+
 
 class CouponBond:
     # Python constructor
@@ -58,6 +75,7 @@ class CouponBond:
         #
         self.payTimes = payTimes
         self.cashFlows = cashFlows
+        self.coefficients = None  # zero bond coefficients for atBatch
 
     # function
     def at(self, x):
@@ -68,6 +86,15 @@ class CouponBond:
             )
         return bond
 
+    # function evaluated for all states X [nPaths, size] at once
+    def atBatch(self, X):
+        if self.coefficients is None:
+            self.coefficients = self.model.zeroBondCoefficients(
+                self.observationTime, self.payTimes
+            )
+        P = self.model.zeroBondPayoffMatrix(X, self.coefficients)
+        return P.dot(np.array(self.cashFlows))
+
 
 class SwapRate:
     # Python constructor
@@ -82,6 +109,10 @@ class SwapRate:
         if tmp[-1] < endTime:
             tmp = tmp + [endTime]
         self.annuityTimes = np.array(tmp)
+        # zero bond times [start, end, annuity times] and coefficients
+        self.bondTimes = np.concatenate([[startTime, endTime], self.annuityTimes[1:]])
+        self.yearFractions = self.annuityTimes[1:] - self.annuityTimes[:-1]
+        self.coefficients = None
 
     # function
     def at(self, x):
@@ -94,3 +125,36 @@ class SwapRate:
             x, self.observationTime, self.startTime
         ) - self.model.zeroBondPayoff(x, self.observationTime, self.endTime)
         return floatLeg / annuity
+
+    # function evaluated for all states X [nPaths, size] at once
+    def atBatch(self, X):
+        if self.coefficients is None:
+            self.coefficients = self.model.zeroBondCoefficients(
+                self.observationTime, self.bondTimes
+            )
+        P = self.model.zeroBondPayoffMatrix(X, self.coefficients)
+        annuity = P[:, 2:].dot(self.yearFractions)
+        floatLeg = P[:, 0] - P[:, 1]
+        return floatLeg / annuity
+
+
+# control variates for MCSimulation.npv, these are payoffs paid at expiry
+# together with their analytical prices in the Hull-White model
+
+
+def ZeroBondOptionControl(hwModel, expiryTime, maturityTime, strikePrice, callOrPut):
+    bond = CouponBond(hwModel, expiryTime, [maturityTime], [1.0])
+    payoff = Pay(VanillaOption(bond, strikePrice, callOrPut), expiryTime)
+    price = hwModel.zeroBondOption(expiryTime, maturityTime, strikePrice, callOrPut)
+    return [payoff, price]
+
+
+def CouponBondOptionControl(
+    hwModel, expiryTime, payTimes, cashFlows, strikePrice, callOrPut
+):
+    bond = CouponBond(hwModel, expiryTime, payTimes, cashFlows)
+    payoff = Pay(VanillaOption(bond, strikePrice, callOrPut), expiryTime)
+    price = hwModel.couponBondOption(
+        expiryTime, payTimes, cashFlows, strikePrice, callOrPut
+    )
+    return [payoff, price]
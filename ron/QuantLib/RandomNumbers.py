@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+# Random number sources for Monte Carlo simulation. A source provides
+# standard normal increments dW [nPaths, nSteps, factors] for a time grid
+#   standardNormals(nPaths, times, factors)
+#     draws from a single stream, consecutive calls continue the stream
+#   blockStandardNormals(blockIdx, nPaths, times, factors)
+#     draws from an independent, reproducible stream for each path block
+#   restart()
+#     resets the single stream to its initial state
+# and flags quasiRandom sources; their paths are not independent, Monte Carlo
+# errors follow from independently scrambled blocks instead
+
+
+class PseudoRandomNumbers:
+
+    # Python constructor
+    def __init__(self, seed=123):
+        self.seed = seed
+        self.quasiRandom = False
+        self.restart()
+
+    def restart(self):
+        self.rng = np.random.RandomState(self.seed)
+
+    def standardNormals(self, nPaths, times, factors):
+        return self.rng.standard_normal([nPaths, len(times) - 1, factors])
+
+    def blockStandardNormals(self, blockIdx, nPaths, times, factors):
+        # equivalent to SeedSequence(seed).spawn(nBlocks)[blockIdx]
+        seedSequence = np.random.SeedSequence(self.seed, spawn_key=(blockIdx,))
+        return np.random.Generator(np.random.PCG64(seedSequence)).standard_normal(
+            [nPaths, len(times) - 1, factors]
+        )
+
+
+class BrownianBridge:
+
+    # Python constructor
+    def __init__(self, times):
+        self.times = np.array(times)  # [0, ..., T]
+        # construction order: terminal point first, then recursive bisection;
+        # each step k sets W[idx] from W[left] and W[right] (right=-1 for none)
+        n = self.times.shape[0] - 1
+        self.idx = np.zeros(n, dtype=int)
+        self.left = np.zeros(n, dtype=int)
+        self.right = np.zeros(n, dtype=int)
+        self.leftWeight = np.zeros(n)
+        self.rightWeight = np.zeros(n)
+        self.stdDev = np.zeros(n)
+        self.idx[0] = n
+        self.right[0] = -1
+        self.leftWeight[0] = 1.0
+        self.stdDev[0] = np.sqrt(self.times[n] - self.times[0])
+        intervals = [(0, n)]
+        k = 1
+        while k < n:
+            nextIntervals = []
+            for l, r in intervals:
+                if r - l < 2:
+                    continue
+                m = (l + r) // 2
+                tl, tm, tr = self.times[l], self.times[m], self.times[r]
+                self.idx[k] = m
+                self.left[k] = l
+                self.right[k] = r
+                self.leftWeight[k] = (tr - tm) / (tr - tl)
+                self.rightWeight[k] = (tm - tl) / (tr - tl)
+                self.stdDev[k] = np.sqrt((tm - tl) * (tr - tm) / (tr - tl))
+                nextIntervals += [(l, m), (m, r)]
+                k += 1
+            intervals = nextIntervals
+
+    # map independent normals Z [nPaths, nSteps] to standardised
+    # Brownian increments dW [nPaths, nSteps]
+    def increments(self, Z):
+        W = np.zeros([Z.shape[0], self.times.shape[0]])
+        for k in range(self.idx.shape[0]):
+            W[:, self.idx[k]] = self.leftWeight[k] * W[:, self.left[k]] + (
+                self.stdDev[k] * Z[:, k]
+            )
+            if self.right[k] >= 0:
+                W[:, self.idx[k]] += self.rightWeight[k] * W[:, self.right[k]]
+        return (W[:, 1:] - W[:, :-1]) / np.sqrt(self.times[1:] - self.times[:-1])
+
+
+class SobolBrownianBridge:
+    # scrambled Sobol sequence with Brownian bridge path construction; the
+    # leading Sobol dimensions drive the terminal and coarse bridge points
+    # of each factor. Path counts should be powers of 2 for best uniformity.
+
+    # Python constructor
+    def __init__(self, seed=123):
+        self.seed = seed
+        self.quasiRandom = True
+        self.restart()
+
+    def restart(self):
+        self.engines = {}  # Sobol engines per dimension
+
+    def sobolNormals(self, engine, nPaths, times, factors):
+        nSteps = len(times) - 1
+        U = engine.random(nPaths)
+        Z = ndtri(np.clip(U, 1.0e-16, 1.0 - 1.0e-16))
+        # dimension k * factors + f drives bridge step k of factor f
+        Z = Z.reshape([nPaths, nSteps, factors])
+        bridge = BrownianBridge(times)
+        dW = np.zeros([nPaths, nSteps, factors])
+        for f in range(factors):
+            dW[:, :, f] = bridge.increments(Z[:, :, f])
+        return dW
+
+    def standardNormals(self, nPaths, times, factors):
+        d = (len(times) - 1) * factors
+        if d not in self.engines:
+            self.engines[d] = qmc.Sobol(d, scramble=True, seed=self.seed)
+        return self.sobolNormals(self.engines[d], nPaths, times, factors)
+
+    def blockStandardNormals(self, blockIdx, nPaths, times, factors):
+        # independent scrambling for each block
+        seedSequence = np.random.SeedSequence(self.seed, spawn_key=(blockIdx,))
+        engine = qmc.Sobol(
+            (len(times) - 1) * factors,
+            scramble=True,
+            seed=np.random.Generator(np.random.PCG64(seedSequence)),
+        )
+        return self.sobolNormals(engine, nPaths, times, factors)
+
+
+class AntitheticNumbers:
+    # decorate a random number source with antithetic variates; paths 2i and
+    # 2i+1 use increments dW and -dW, an odd last path is not paired
+
+    # Python constructor
+    def __init__(self, randomNumbers):
+        self.randomNumbers = randomNumbers
+        self.quasiRandom = getattr(randomNumbers, "quasiRandom", False)
+
+    def restart(self):
+        self.randomNumbers.restart()
+
+    def pairs(self, dW, nPaths):
+        return np.stack([dW, -dW], axis=1).reshape((-1,) + dW.shape[1:])[:nPaths]
+
+    def standardNormals(self, nPaths, times, factors):
+        dW = self.randomNumbers.standardNormals((nPaths + 1) // 2, times, factors)
+        return self.pairs(dW, nPaths)
+
+    def blockStandardNormals(self, blockIdx, nPaths, times, factors):
+        dW = self.randomNumbers.blockStandardNormals(
+            blockIdx, (nPaths + 1) // 2, times, factors
+        )
+        return self.pairs(dW, nPaths)
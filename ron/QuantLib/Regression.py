@@ -1,7 +1,8 @@
 #!/usr/bin/python
 
 import numpy as np
-from scipy.linalg import lstsq
+from scipy.linalg import cho_factor, cho_solve, lstsq, qr_multiply, solve_triangular
+from scipy.linalg.lapack import dpocon
 
 
 def MultiIndexSet(n, k):
@@ -18,16 +19,51 @@ class Regression:
         self.multiIdxSet = np.array(
             MultiIndexSet(controls.shape[1], maxPolynomialDegree + 1)
         )
-        A = np.array([self.monomials(c) for c in controls])
-        p, res, rnk, s = lstsq(A, observations)  # res, rnk, s for debug purposes
-        self.beta = p
+        A = self.monomialsBatch(controls)
+        self.beta = self.solve(A, observations)
+
+    def solve(self, A, observations):
+        # least squares for the tall-skinny design matrix A via Cholesky
+        # decomposition of the normal equations with scaled columns; if these
+        # are ill-conditioned we use a QR decomposition without forming Q,
+        # and SVD based lstsq for rank deficient or under-determined systems
+        if A.shape[0] < A.shape[1]:
+            return lstsq(A, observations)[0]
+        G = A.T.dot(A)
+        scale = np.sqrt(np.diag(G))
+        if np.min(scale) > 0.0:
+            G = G / np.outer(scale, scale)
+            try:
+                [C, lower] = cho_factor(G)
+                rcond = dpocon(C, np.max(np.sum(np.abs(G), axis=0)))[0]
+            except np.linalg.LinAlgError:  # G not positive definite
+                rcond = 0.0
+            if rcond > 1.0e-8:
+                Aty = A.T.dot(observations)
+                scaleAty = scale if Aty.ndim == 1 else scale[:, np.newaxis]
+                return cho_solve([C, lower], Aty / scaleAty) / scaleAty
+        [QTy, R] = qr_multiply(A, np.asarray(observations).T, mode="right")
+        d = np.abs(np.diag(R))
+        if np.min(d) <= 1.0e-12 * np.max(d):
+            p, res, rnk, s = lstsq(A, observations)  # res, rnk, s for debug purposes
+            return p
+        return solve_triangular(R, QTy.T)
+
+    def monomialsBatch(self, controls):
+        # design matrix [nSamples, nMonomials] for controls [nSamples, nControls];
+        # powers of each control are tabulated once and combined per multi-index
+        degrees = np.arange(self.maxPolynomialDegree + 1)
+        A = np.ones([controls.shape[0], self.multiIdxSet.shape[0]])
+        for j in range(self.multiIdxSet.shape[1]):
+            powers = controls[:, j : j + 1] ** degrees  # [nSamples, degree+1]
+            A *= powers[:, self.multiIdxSet[:, j]]
+        return A
 
     def monomials(self, control):
-        x = np.ones(self.multiIdxSet.shape[0])
-        for i in range(self.multiIdxSet.shape[0]):
-            for j in range(self.multiIdxSet.shape[1]):
-                x[i] *= control[j] ** self.multiIdxSet[i][j]
-        return x
+        return self.monomialsBatch(np.array(control, ndmin=2))[0]
 
     def value(self, control):
         return self.monomials(control).dot(self.beta)
+
+    def valueBatch(self, controls):
+        return self.monomialsBatch(controls).dot(self.beta)
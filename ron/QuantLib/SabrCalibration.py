@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+import multiprocessing
+
+import numpy as np
+from scipy.optimize import least_squares
+
+from SabrModel import SabrModel
+
+
+class SabrSmileCalibration:
+    # calibrate alpha, nu and rho of a SABR smile with fixed beta and shift
+    # to market normal volatilities via Levenberg-Marquardt; the optimiser
+    # works on unconstrained z = [log alpha, log nu, arctanh rho]
+
+    # Python constructor
+    def __init__(
+        self,
+        forward,
+        timeToExpiry,
+        strikes,
+        marketVols,
+        beta=0.5,
+        shift=0.0,
+        weights=None,
+    ):
+        self.forward = forward
+        self.timeToExpiry = timeToExpiry
+        self.strikes = np.array(strikes, dtype=float)
+        self.marketVols = np.array(marketVols, dtype=float)
+        self.beta = beta
+        self.shift = shift
+        self.weights = np.ones(self.strikes.shape) if weights is None else weights
+
+    def parameters(self, z):  # [alpha, nu, rho], z may be [..., 3]
+        z = np.asarray(z)
+        return [np.exp(z[..., 0]), np.exp(z[..., 1]), np.tanh(z[..., 2])]
+
+    def unconstrained(self, parameters):
+        [alpha, nu, rho] = parameters
+        rho = np.clip(rho, -0.9999, 0.9999)
+        return np.array([np.log(alpha), np.log(nu), np.arctanh(rho)])
+
+    def model(self, parameters):
+        [alpha, nu, rho] = parameters
+        return SabrModel(
+            self.forward, self.timeToExpiry, alpha, self.beta, nu, rho, self.shift
+        )
+
+    def initialParameters(self):
+        # nu and rho from the best fit on a coarse grid which avoids local
+        # minima for long expiries, alpha is rescaled to the ATM volatility
+        atmVol = np.interp(self.forward, self.strikes, self.marketVols)
+        [nu, rho] = np.meshgrid([0.1, 0.25, 0.5, 1.0], [-0.6, -0.3, 0.0, 0.3, 0.6])
+        [nu, rho] = [nu.ravel(), rho.ravel()]
+        alpha = atmVol / self.model([1.0, 0.5, 0.0]).localVolC(self.forward)
+        alpha = np.full(nu.shape, alpha)
+        with np.errstate(all="ignore"):  # invalid grid points are discarded
+            for k in range(3):  # fixed point iteration on the ATM volatility
+                model = self.model([alpha, nu, rho])
+                alpha = alpha * atmVol / model.normalVolatility(self.forward)
+            Z = np.stack([np.log(alpha), np.log(nu), np.arctanh(rho)], axis=1)
+            errors = np.sum(self.residualsBatch(Z) ** 2, axis=1)
+        errors = np.where(np.isfinite(errors), errors, np.inf)
+        return self.parameters(Z[np.argmin(errors)])
+
+    def residualsBatch(self, Z):
+        # residuals [nParameterSets, nStrikes] for Z [nParameterSets, 3],
+        # all parameter sets are evaluated in a single broadcast call
+        [alpha, nu, rho] = self.parameters(Z)
+        model = self.model(
+            [alpha[:, np.newaxis], nu[:, np.newaxis], rho[:, np.newaxis]]
+        )
+        return self.weights * (model.normalVolatility(self.strikes) - self.marketVols)
+
+    def residuals(self, z):
+        return self.residualsBatch(np.array(z, ndmin=2))[0]
+
+    def jacobian(self, z, eps=1.0e-6):
+        # central differences, bumped parameter sets are evaluated together
+        bumps = eps * np.vstack([np.eye(3), -np.eye(3)])
+        R = self.residualsBatch(z + bumps)
+        return ((R[:3] - R[3:]) / (2.0 * eps)).T
+
+    def calibrate(self, initialParameters=None, tolerance=1.0e-12):
+        # returns [alpha, nu, rho] and stores the fit error in self.rmse;
+        # pass previous parameters as initialParameters for a warm start
+        if initialParameters is None:
+            initialParameters = self.initialParameters()
+        result = least_squares(
+            self.residuals,
+            self.unconstrained(initialParameters),
+            jac=self.jacobian,
+            method="lm",
+            xtol=tolerance,
+            ftol=tolerance,
+        )
+        self.nEvaluations = result.nfev
+        self.rmse = np.sqrt(np.mean(result.fun ** 2))
+        return np.array(self.parameters(result.x))
+
+
+def _calibrateSmile(args):
+    [smile, initialParameters] = args
+    parameters = smile.calibrate(initialParameters)
+    return [parameters, smile.rmse, smile.nEvaluations]
+
+
+class SabrCubeCalibration:
+    # calibrate independent smiles, e.g. all expiry x tenor points of a
+    # swaption cube, distributed to a process pool; calibrated parameters
+    # are kept as warm start for the next calibration (e.g. next day)
+
+    # Python constructor
+    def __init__(self, smiles, nWorkers=None):
+        self.smiles = smiles  # list of SabrSmileCalibration
+        self.nWorkers = multiprocessing.cpu_count() if nWorkers is None else nWorkers
+        self.parameters = None  # [nSmiles, 3] of [alpha, nu, rho]
+
+    def updateSmiles(self, smiles):
+        # new market data for the same cube points, parameters are kept
+        self.smiles = smiles
+
+    def calibrate(self, initialParameters=None):
+        if initialParameters is None and self.parameters is not None:
+            initialParameters = self.parameters  # warm start
+        if initialParameters is None:
+            initialParameters = [None] * len(self.smiles)
+        tasks = list(zip(self.smiles, initialParameters))
+        if self.nWorkers == 1 or len(tasks) == 1:
+            results = [_calibrateSmile(task) for task in tasks]
+        else:
+            with multiprocessing.Pool(min(self.nWorkers, len(tasks))) as pool:
+                results = pool.map(_calibrateSmile, tasks)
+        self.parameters = np.array([r[0] for r in results])
+        self.rmse = np.array([r[1] for r in results])
+        self.nEvaluations = np.array([r[2] for r in results])
+        return self.parameters
+
+    def models(self):
+        return [
+            smile.model(parameters)
+            for smile, parameters in zip(self.smiles, self.parameters)
+        ]
@@ -17,16 +17,18 @@ class SabrModel:
         self.rho = rho
         self.shift = shift
 
-    # helpers
+    # helpers; rates may be float or np.array, model parameters may be
+    # np.arrays broadcastable against rates to evaluate several smiles at once
     def localVolC(self, rate):
-        return np.power(rate + self.shift, self.beta) if rate > -self.shift else 0.0
+        above = rate > -self.shift
+        rateShifted = np.where(above, rate + self.shift, 1.0)
+        return np.where(above, np.power(rateShifted, self.beta), 0.0)[()]
 
     def localVolCPrime(self, rate):  # for Milstein method
-        return (
-            self.beta * np.power(rate + self.shift, self.beta - 1)
-            if rate > -self.shift
-            else 0.0
-        )
+        above = rate > -self.shift
+        rateShifted = np.where(above, rate + self.shift, 1.0)
+        CPrime = np.where(above, self.beta * np.power(rateShifted, self.beta - 1), 0.0)
+        return CPrime[()]
 
     def sAverage(self, strike, forward):
         return (strike + forward) / 2.0
@@ -49,24 +51,29 @@ class SabrModel:
             / (1 - self.rho)
         )
 
-    # approximate implied normal volatility formula
-    def normalVolatility(self, strike):
-        Sav = self.sAverage(strike, self.forward)
+    # approximate implied normal volatility formula; strike and forward
+    # (default self.forward) may be np.arrays, e.g. strikes [nStrikes] and
+    # forwards [nForwards, 1] give a [nForwards, nStrikes] smile grid
+    def normalVolatility(self, strike, forward=None):
+        forward = self.forward if forward is None else forward
+        Sav = self.sAverage(strike, forward)
         CSav = self.localVolC(Sav)
         gamma1 = self.beta / (Sav + self.shift)
         gamma2 = self.beta * (self.beta - 1) / (Sav + self.shift) / (Sav + self.shift)
         I1 = (2 * gamma2 - gamma1 * gamma1) / 24 * self.alpha * self.alpha * CSav * CSav
         I1 = I1 + self.rho * self.nu * self.alpha * gamma1 / 4 * CSav
         I1 = I1 + (2 - 3 * self.rho * self.rho) / 24 * self.nu * self.nu
-        sigmaN = self.alpha * CSav  # default, if close to ATM
-        if np.fabs(strike - self.forward) > 1.0e-8:  # actual calculation for I0
-            sigmaN = (
-                self.nu
-                * (self.forward - strike)
-                / self.chi(self.zeta(strike, self.forward))
-            )
+        atm = np.fabs(strike - forward) <= 1.0e-8  # default, if close to ATM
+        strikeOrDummy = np.where(atm, forward - 1.0e-4, strike)  # avoid 0 / 0
+        sigmaN = np.where(
+            atm,
+            self.alpha * CSav,
+            self.nu  # actual calculation for I0
+            * (forward - strikeOrDummy)
+            / self.chi(self.zeta(strikeOrDummy, forward)),
+        )
         sigmaN = sigmaN * (1 + I1 * self.timeToExpiry)  # higher order adjustment
-        return sigmaN
+        return sigmaN[()]
 
     def calibrateATM(self, sigmaATM):
         def objective(alpha):
@@ -77,25 +84,64 @@ class SabrModel:
         self.alpha = brentq(objective, 0.5 * alpha0, 2.0 * alpha0, xtol=1.0e-8)
         return self.alpha
 
-    def vanillaPrice(self, strike, callOrPut):
-        sigmaN = self.normalVolatility(strike)
-        return Bachelier(strike, self.forward, sigmaN, self.timeToExpiry, callOrPut)
-
-    def density(self, rate):
-        eps = 1.0e-4
-        cop = 1.0
-        if rate < self.forward:
-            cop = -1.0
-        dens = (
-            (
-                self.vanillaPrice(rate - eps, cop)
-                - 2 * self.vanillaPrice(rate, cop)
-                + self.vanillaPrice(rate + eps, cop)
-            )
-            / eps
-            / eps
+    def vanillaPrice(self, strike, callOrPut, forward=None):
+        forward = self.forward if forward is None else forward
+        sigmaN = self.normalVolatility(strike, forward)
+        return Bachelier(strike, forward, sigmaN, self.timeToExpiry, callOrPut)
+
+    # density d2V/dK2 of the Bachelier price V(K, sigma(K)) through the smile
+    #   d2V/dK2 = V_KK + 2 V_Ks s' + V_ss s'^2 + V_s s''
+    #           = phi(h) / nu (1 + sqrt(T) h s')^2 + sqrt(T) phi(h) s''
+    # with nu = s sqrt(T), h = (F - K) / nu; smile derivatives s', s'' by
+    # central differences of normalVolatility evaluated in a single call.
+    # With arbitrageFree=True, rate must be an increasing grid (last axis)
+    # covering the forward; negative densities are floored and the density
+    # is tilted p -> p exp(a + b (r - F)) such that (trapezoidal) mass is 1
+    # and mean is the forward. This yields a martingale density on the grid,
+    # call prices agree with the smile only as far as the smile itself is
+    # free of arbitrage.
+    def density(self, rate, forward=None, arbitrageFree=False):
+        forward = self.forward if forward is None else forward
+        [rate, forward] = np.broadcast_arrays(
+            np.asarray(rate, dtype=float), np.asarray(forward, dtype=float)
         )
-        return dens
+        eps = 1.0e-4
+        bumps = eps * np.array([-1.0, 0.0, 1.0]).reshape((3,) + (1,) * rate.ndim)
+        [sDown, s, sUp] = self.normalVolatility(rate + bumps, forward[np.newaxis])
+        sPrime = (sUp - sDown) / 2.0 / eps
+        sPrime2 = (sUp - 2.0 * s + sDown) / eps / eps
+        sqrtT = np.sqrt(self.timeToExpiry)
+        nu = s * sqrtT
+        h = (forward - rate) / nu
+        phi = np.exp(-0.5 * h * h) / np.sqrt(2.0 * np.pi)
+        dens = phi / nu * (1.0 + sqrtT * h * sPrime) ** 2 + sqrtT * phi * sPrime2
+        if arbitrageFree:
+            dens = self.martingaleDensity(rate, forward, np.maximum(dens, 0.0))
+        return dens[()]
+
+    # exponential tilt of a non-negative density p on grid(s) rate (last axis)
+    # with unit trapezoidal mass and mean forward; b solves the tilted mean
+    # E_b[r - F] = 0 by Newton iterations with derivative Var_b[r - F] > 0
+    def martingaleDensity(self, rate, forward, dens, maxIterations=100):
+        dr = np.diff(rate, axis=-1)
+        weights = np.zeros(rate.shape)  # trapezoidal rule
+        weights[..., 1:] += 0.5 * dr
+        weights[..., :-1] += 0.5 * dr
+        y = rate - forward
+        scale = np.sqrt(np.sum(weights * dens * y * y, axis=-1, keepdims=True))
+        b = np.zeros(scale.shape)
+        for k in range(maxIterations):
+            exponent = b * y - np.max(b * y, axis=-1, keepdims=True)  # no overflow
+            q = weights * dens * np.exp(exponent)
+            q = q / np.sum(q, axis=-1, keepdims=True)
+            mean = np.sum(q * y, axis=-1, keepdims=True)
+            var = np.sum(q * (y - mean) ** 2, axis=-1, keepdims=True)
+            step = np.clip(mean / var, -1.0 / scale, 1.0 / scale)  # damped
+            b = b - step
+            if np.all(np.abs(mean) < 1.0e-14 * scale):
+                break
+        tilted = dens * np.exp(b * y - np.max(b * y, axis=-1, keepdims=True))
+        return tilted / np.sum(weights * tilted, axis=-1, keepdims=True)
 
     # stochastic process interface
 
@@ -134,32 +180,43 @@ class SabrModel:
         # gather results
         return np.array([S1, alpha1])
 
+    # batch version of evolve, X0 is np.array [nPaths, size] and
+    # dW is np.array [nPaths, factors]
+    def evolveBatch(self, t0, X0, dt, dW):
+        # first simulate stochastic volatility exact
+        dZ = self.rho * dW[:, 0] + np.sqrt(1 - self.rho * self.rho) * dW[:, 1]
+        alpha0 = X0[:, 1]
+        alpha1 = alpha0 * np.exp(
+            -self.nu * self.nu / 2 * dt + self.nu * dZ * np.sqrt(dt)
+        )
+        alpha01 = np.sqrt(alpha0 * alpha1)  # average vol [t0, t0+dt]
+        # local vol and its derivative, masked below -shift
+        S0 = X0[:, 0]
+        C0 = self.localVolC(S0)
+        CPrime0 = self.localVolCPrime(S0)
+        # simulate S via Milstein
+        S1 = (
+            S0
+            + alpha01 * C0 * dW[:, 0] * np.sqrt(dt)
+            + 0.5 * alpha01 * C0 * alpha01 * CPrime0 * (dW[:, 0] * dW[:, 0] - 1) * dt
+        )
+        # gather results
+        return np.stack([S1, alpha1], axis=1)
+
     # calculate normal volatility smile from a MC simulation
     def monteCarloImpliedNormalVol(self, mcSimulation, strikes, fullOutput=False):
         if mcSimulation.times[-1] != self.timeToExpiry:
             print("WARNING: times do not match.")
         # forward adjuster
-        Sav = 0.0
-        for j in range(mcSimulation.nPaths):
-            Sav += mcSimulation.X[j][-1][0]
-        Sav /= mcSimulation.nPaths
-        S = np.array(
-            [
-                (mcSimulation.X[j][-1][0] + self.forward - Sav)
-                for j in range(mcSimulation.nPaths)
-            ]
+        ST = np.array(mcSimulation.X)[:, -1, 0]
+        S = ST + self.forward - np.mean(ST)
+        strikes = np.array(strikes)
+        cop = np.where(strikes > self.forward, 1.0, -1.0)
+        options = np.mean(
+            np.maximum(cop * (S[:, np.newaxis] - strikes[np.newaxis, :]), 0.0), axis=0
+        )
+        vols = BachelierImpliedVol(
+            options, strikes, self.forward, mcSimulation.times[-1], cop
         )
-        options = np.zeros(len(strikes))
-        vols = np.zeros(len(strikes))
-        for i in range(len(strikes)):
-            cop = 1.0 if strikes[i] > self.forward else -1.0
-            for j in range(mcSimulation.nPaths):
-                options[i] += np.max([cop * (S[j] - strikes[i]), 0.0])
-            options[i] /= mcSimulation.nPaths
-            try:
-                vols[i] = BachelierImpliedVol(
-                    options[i], strikes[i], self.forward, mcSimulation.times[-1], cop
-                )
-            except:
-                vols[i] = 0.0
+        vols = np.where(np.isnan(vols), 0.0, vols)  # arbitrage violations
         return vols if not fullOutput else np.array(strikes, options, vols)
@@ -267,9 +267,7 @@ def HullWhiteModelFromSwaption(swaption, meanReversion=0.01):
     )
 
 
-class CashSettledSwaptionPayoff:
-    # A Swaption is a priori assumed physically settled. However, we also want
-    # to price cash-settled swaptions via Hull White and numerical methods
+class CashAnnuityPayoff:  # base class for cash-settled swap rate payoffs
 
     # Python constructor
     def __init__(self, swaption, hwModel):
@@ -281,6 +279,41 @@ class CashSettledSwaptionPayoff:
         # this is what we find in most papers
         # this should work for annual to quarterly compounding
         self.tau = round(4.0 * self.details["annuityLeg"][-1][1]) / 4.0
+        self.coefficients = None  # zero bond coefficients for atBatch
+
+    # annuity and float leg for all states X [nPaths, size] as matrix-vector
+    # products, zero bond coefficients are calculated once
+    def legsBatch(self, X):
+        nAnnuity = self.details["annuityLeg"].shape[0]
+        if self.coefficients is None:
+            payTimes = np.concatenate(
+                [self.details["annuityLeg"][:, 0], self.details["floatLeg"][:, 0]]
+            )
+            self.coefficients = self.model.zeroBondCoefficients(
+                self.details["expiryTime"], payTimes
+            )
+        P = self.model.zeroBondPayoffMatrix(X, self.coefficients)
+        annuity = P[:, :nAnnuity].dot(self.details["annuityLeg"][:, 1])
+        floatLeg = P[:, nAnnuity:].dot(self.details["floatLeg"][:, 1])
+        return [annuity, floatLeg]
+
+    # annuity, swap rate and cash-settlement annuity for all states X
+    def swapRateBatch(self, X):
+        [annuity, floatLeg] = self.legsBatch(X)
+        swapRate = floatLeg / annuity
+        cashAnnuity = np.zeros(X.shape[0])
+        for k in range(self.details["annuityLeg"].shape[0]):
+            cashAnnuity += self.tau / np.power(1.0 + self.tau * swapRate, k + 1)
+        return [annuity, swapRate, cashAnnuity]
+
+
+class CashSettledSwaptionPayoff(CashAnnuityPayoff):
+    # A Swaption is a priori assumed physically settled. However, we also want
+    # to price cash-settled swaptions via Hull White and numerical methods
+
+    # Python constructor
+    def __init__(self, swaption, hwModel):
+        CashAnnuityPayoff.__init__(self, swaption, hwModel)
         print(self.tau)
 
     def at(self, x):
@@ -307,18 +340,21 @@ class CashSettledSwaptionPayoff:
             * (swapRate - self.details["strikeRate"])
         )
 
+    # payoff evaluated for all states X [nPaths, size] at once
+    def atBatch(self, X):
+        [annuity, swapRate, cashAnnuity] = self.swapRateBatch(X)
+        return (
+            self.details["notional"]
+            * cashAnnuity
+            * self.details["callOrPut"]
+            * (swapRate - self.details["strikeRate"])
+        )
+
 
-class CashPhysicalSwitchPayoff:
+class CashPhysicalSwitchPayoff(CashAnnuityPayoff):
     # Python constructor
     def __init__(self, swaption, hwModel):
-        self.swaption = swaption
-        self.model = hwModel
-        # we pre-calculate some quantities
-        self.details = swaption.swaptionDetails()
-        # we calculate a uniform year fraction for compounding
-        # this is what we find in most papers
-        # this should work for annual to quarterly compounding
-        self.tau = round(4.0 * self.details["annuityLeg"][-1][1]) / 4.0
+        CashAnnuityPayoff.__init__(self, swaption, hwModel)
 
     def at(self, x):
         annuity = 0.0
@@ -343,3 +379,11 @@ class CashPhysicalSwitchPayoff:
             * np.abs(swapRate - self.details["strikeRate"])
         )
 
+    # payoff evaluated for all states X [nPaths, size] at once
+    def atBatch(self, X):
+        [annuity, swapRate, cashAnnuity] = self.swapRateBatch(X)
+        return (
+            self.details["notional"]
+            * (annuity - cashAnnuity)
+            * np.abs(swapRate - self.details["strikeRate"])
+        )
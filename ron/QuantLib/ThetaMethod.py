@@ -1,39 +1,50 @@
 #!/usr/bin/python
 
-from scipy.sparse import diags, identity
+from scipy.linalg.lapack import dgtsv
 import numpy as np
 
+# Tridiagonal matrices M = diag[l, c, u] are given by their raw diagonals
+# l [n-1], c [n], u [n-1]; no (sparse) matrices are allocated per time step.
+# Right hand sides may be [n] or [n, nTrades], diagonals may be shared by
+# all trades or given per trade as [n(-1), nTrades].
 
-def solveTDS(diagA, y):
-    # solve linear systen Ax = y for a tridiagonal matrix A
-    a = diagA.diagonal(-1)
-    b = diagA.diagonal(0)
-    c = diagA.diagonal(1)
-    # in place LU decomposition; no error handling if LU decomposition does not exist
-    for i in range(1, b.shape[0]):
-        a[i - 1] /= b[i - 1]
-        b[i] -= c[i - 1] * a[i - 1]
-    # forward substitution
-    z = np.zeros(b.shape[0])
-    z[0] = y[0]
-    for i in range(1, z.shape[0]):
-        z[i] = y[i] - a[i - 1] * z[i - 1]
-    # backward substitution, overwrite input y
-    y[-1] = z[-1] / b[-1]
-    for i in range(z.shape[0] - 1, 0, -1):
-        y[i - 1] = (z[i - 1] - c[i - 1] * y[i]) / b[i - 1]
-    return
+
+def tridiagonalDot(arrayL, arrayC, arrayU, arrayRHS):
+    # matrix-vector product M r
+    [l, c, u] = [
+        d[:, np.newaxis] if len(d.shape) < len(arrayRHS.shape) else d
+        for d in [arrayL, arrayC, arrayU]
+    ]
+    Mr = c * arrayRHS
+    Mr[1:] += l * arrayRHS[:-1]
+    Mr[:-1] += u * arrayRHS[1:]
+    return Mr
+
+
+def solveTDS(arrayL, arrayC, arrayU, y):
+    # solve linear system Ax = y for A = diag[l, c, u] via LAPACK gtsv (LU
+    # decomposition with partial pivoting); shared diagonals solve all right
+    # hand sides in a single call, per trade diagonals are solved by trade;
+    # no error handling if A is singular
+    if len(arrayC.shape) == 1:
+        return dgtsv(arrayL, arrayC, arrayU, y)[3]
+    x = np.empty(y.shape)
+    for j in range(y.shape[1]):
+        x[:, j] = dgtsv(arrayL[:, j], arrayC[:, j], arrayU[:, j], y[:, j])[3]
+    return x
 
 
 def thetaStep(arrayL, arrayC, arrayU, arrayRHS, stepSize, theta):
     # solve v = [I+h*theta*M]^-1 [I-h(1-theta)M] r
     # where M = diag[l, c, u] and r = RHS
-    M = diags([arrayL, arrayC, arrayU], [-1, 0, 1])
-    # print(M.toarray())
-    I = identity(arrayC.shape[0])
-    b = (I - (stepSize * (1.0 - theta)) * M).dot(arrayRHS)
+    b = arrayRHS - (stepSize * (1.0 - theta)) * tridiagonalDot(
+        arrayL, arrayC, arrayU, arrayRHS
+    )
     if theta == 0:  # Explicit Euler
         return b
-    A = I + (stepSize * theta) * M
-    solveTDS(A, b)
-    return b
+    return solveTDS(
+        (stepSize * theta) * arrayL,
+        1.0 + (stepSize * theta) * arrayC,
+        (stepSize * theta) * arrayU,
+        b,
+    )
@@ -5,7 +5,10 @@
 
 import QuantLib as ql
 
+from collections import OrderedDict
+
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas
 
 DAY_COUNTERS = {
@@ -58,6 +61,7 @@ class YieldCurve:
         day_counter=ql.Actual360(),
         calendar=ql.NullCalendar(),
         interpolation=ql.BackwardFlat(),
+        cacheSize=None,
     ):
         today = ql.Settings.getEvaluationDate(ql.Settings.instance())
         self.terms = terms
@@ -69,6 +73,10 @@ class YieldCurve:
         self.yts = ql.ForwardCurve(
             self.dates, self.rates, day_counter, calendar, interpolation
         )
+        # optional LRU cache for repeated discount and forward rate lookups
+        self.cache = None
+        if cacheSize is not None:
+            self.cache = CachedTermStructure(self.yts, cacheSize)
 
     # Calculate continously compounded rates from simple rates array
     def simpleToContinuousRates(self, simpleRates, dates, day_counter=ql.Actual360()):
@@ -84,11 +92,24 @@ class YieldCurve:
 
     # zero coupon bond
     def discount(self, dateOrTime):
+        if self.cache is not None:
+            return self.cache.discount(dateOrTime)
         return self.yts.discount(dateOrTime, True)
 
     def forwardRate(self, time):
+        if self.cache is not None:
+            return self.cache.forwardRate(time)
         return self.yts.forwardRate(time, time, ql.Continuous, ql.Annual, True).rate()
 
+    # NumPy snapshot of the curve for fast evaluation on arrays of times;
+    # knots are the curve nodes, optionally refined by a grid of stepSize
+    # which is needed for interpolations other than flat or linear forwards
+    def snapshot(self, stepSize=None, tolerance=1.0e-10):
+        knotTimes = [self.yts.timeFromReference(d) for d in self.yts.dates()]
+        if stepSize is not None:
+            knotTimes += list(np.arange(0.0, knotTimes[-1], stepSize))
+        return YieldCurveSnapshot(self.yts, knotTimes, tolerance)
+
     # plot zero rates and forward rate
     def plot(self, stepsize=0.1):
         times = [k * stepsize for k in range(int(round(30.0 / stepsize, 0)) + 1)]
@@ -121,3 +142,150 @@ class YieldCurve:
 
     def referenceDate(self):
         return self.referenceDate()
+
+
+class YieldCurveSnapshot:
+    # Discount factors and instantaneous forward rates of a QuantLib yield
+    # term structure sampled once on knot times. Forward rates are assumed
+    # linear between knots (exact for flat and linear forward interpolation),
+    # at knots the forward rate of the left interval is returned as for
+    # BackwardFlat. Both ends f0, f1 of each interval [t0, t1] follow from
+    # log discount factors at t0, the mid point tm and t1:
+    #   A = log P(t0)/P(tm) = h (3 f0 + f1) / 8
+    #   B = log P(t0)/P(t1) = h (f0 + f1) / 2
+    # Beyond the last knot the forward rate is extrapolated flat.
+
+    # Python constructor
+    def __init__(self, yts, knotTimes, tolerance=1.0e-10):
+        self.knotTimes = np.unique(np.array(knotTimes, dtype=float))
+        t0, t1 = self.knotTimes[:-1], self.knotTimes[1:]
+        h = t1 - t0
+        logDiscount = np.log([yts.discount(t, True) for t in self.knotTimes])
+        logDiscountMid = np.log([yts.discount(t, True) for t in (t0 + t1) / 2])
+        A = logDiscount[:-1] - logDiscountMid
+        B = logDiscount[:-1] - logDiscount[1:]
+        self.logDiscounts = logDiscount
+        self.forwards0 = (4 * A - B) / h  # forward rate at left end
+        self.forwards1 = (3 * B - 4 * A) / h  # forward rate at right end
+        # compare against QuantLib at points not used for calibration
+        testTimes = np.concatenate(
+            [t0 + h / 4, t0 + 3 * h / 4, self.knotTimes[-1:] + [1.0, 10.0]]
+        )
+        qlDiscounts = np.array([yts.discount(t, True) for t in testTimes])
+        errors = [np.max(np.abs(self.discount(testTimes) - qlDiscounts))]
+
+        def qlForwards(times):
+            return np.array(
+                [
+                    yts.forwardRate(t, t, ql.Continuous, ql.Annual, True).rate()
+                    for t in times
+                ]
+            )
+
+        interior = np.concatenate([t0 + h / 4, t0 + 3 * h / 4])
+        errors += [np.max(np.abs(self.forwardRate(interior) - qlForwards(interior)))]
+        # QuantLib averages forward rates over a knot, one-sided forward rates
+        # at knots (left, right of the first knot) are extrapolated linearly
+        knotForwards = np.concatenate(
+            [
+                2 * qlForwards(t0[:1] + h[:1] / 4) - qlForwards(t0[:1] + h[:1] / 2),
+                2 * qlForwards(t1 - h / 4) - qlForwards(t1 - h / 2),
+            ]
+        )
+        errors += [np.max(np.abs(self.forwardRate(self.knotTimes) - knotForwards))]
+        self.maxError = max(errors)
+        if self.maxError > tolerance:
+            print(
+                "WARNING: snapshot differs from yield curve by %.2e, use a smaller stepSize."
+                % self.maxError
+            )
+
+    def interval(self, time, side="right"):
+        # interval index and time since left knot, last interval for
+        # extrapolation; time may be a float or np.array. At knots the
+        # interval right of the knot is used, or left of it for side="left"
+        idx = np.searchsorted(self.knotTimes, time, side=side) - 1
+        idx = np.clip(idx, 0, self.knotTimes.shape[0] - 2)
+        return [idx, time - self.knotTimes[idx]]
+
+    def discount(self, time):
+        [idx, tau] = self.interval(time)
+        h = self.knotTimes[idx + 1] - self.knotTimes[idx]
+        f0, f1 = self.forwards0[idx], self.forwards1[idx]
+        tauIn = np.minimum(tau, h)  # flat extrapolation beyond last knot
+        integral = f0 * tauIn + 0.5 * (f1 - f0) / h * tauIn ** 2 + f1 * (tau - tauIn)
+        return np.exp(self.logDiscounts[idx] - integral)
+
+    def forwardRate(self, time):
+        [idx, tau] = self.interval(time, "left")
+        h = self.knotTimes[idx + 1] - self.knotTimes[idx]
+        f0, f1 = self.forwards0[idx], self.forwards1[idx]
+        return f0 + (f1 - f0) * np.minimum(tau, h) / h
+
+
+class CachedTermStructure:
+    # Bounded LRU cache of discount factors and instantaneous forward rates
+    # of a QuantLib yield term structure or handle, keyed by date or time,
+    # with at most maxSize entries for each of both quantities.
+    # The cache is cleared whenever the term structure notifies a change,
+    # e.g. a relinked handle, a changed quote or a new evaluation date.
+    # Other methods are forwarded to the wrapped term structure.
+
+    # Python constructor
+    def __init__(self, yts, maxSize=10000):
+        self.yts = yts
+        self.maxSize = maxSize
+        self.discounts = OrderedDict()
+        self.forwards = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.observer = ql.Observer(self.clear)
+        self.observer.registerWith(yts)
+
+    def __getattr__(self, name):
+        return getattr(self.yts, name)
+
+    # wrap another term structure, the observer moves to the new one
+    def setTermStructure(self, yts):
+        self.observer.unregisterWith(self.yts)
+        self.yts = yts
+        self.observer.registerWith(yts)
+        self.clear()
+
+    def clear(self):
+        self.discounts.clear()
+        self.forwards.clear()
+        self.invalidations += 1
+
+    def lookup(self, cache, key, value):
+        if key in cache:
+            self.hits += 1
+            cache.move_to_end(key)
+            return cache[key]
+        self.misses += 1
+        cache[key] = value(key)
+        if len(cache) > self.maxSize:
+            cache.popitem(last=False)  # drop least recently used
+        return cache[key]
+
+    def discount(self, dateOrTime):
+        return self.lookup(
+            self.discounts, dateOrTime, lambda t: self.yts.discount(t, True)
+        )
+
+    def forwardRate(self, time):
+        return self.lookup(
+            self.forwards,
+            time,
+            lambda t: self.yts.forwardRate(t, t, ql.Continuous, ql.Annual, True).rate(),
+        )
+
+    def cacheInfo(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "size": len(self.discounts) + len(self.forwards),
+            "maxSize": self.maxSize,
+        }
@@ -13,6 +13,8 @@ import QuantLib as ql
 import types
 import datetime
 
+from YieldCurve import CachedTermStructure
+
 
 # utility class for different QuantLib type conversions
 class Convert:
@@ -147,12 +149,16 @@ class PiecewiseCurveBuilder(object):
         self.conventions = conventions
         self.market = marketData
         self.curves = {}
+        self.cachedCurves = {}
         self.overnightIndexes = {}
         self.curveData = {}
 
     # for a given curve, first assemble bootstrap helpers,
-    # then construct yield term structure handle
-    def Build(self, curve, enableExtrapolation=True):
+    # then construct yield term structure handle; with cacheSize an LRU cache
+    # of discount factors and forward rates on the handle is available via
+    # cachedCurve(curve), it is invalidated when the handle is relinked or
+    # quotes change. Rebuilding a curve moves its cache to the new handle
+    def Build(self, curve, enableExtrapolation=True, cacheSize=None):
 
         # clear all existing bootstrap helpers from list
         self.helpers.clear()
@@ -349,8 +355,21 @@ class PiecewiseCurveBuilder(object):
             curve, data, self.instruments, discounting_yts_handle, dayCounter
         )
 
+        if cacheSize is None:
+            self.cachedCurves.pop(curve, None)
+        elif curve in self.cachedCurves:  # reuse cache and its observer
+            self.cachedCurves[curve].maxSize = cacheSize
+            self.cachedCurves[curve].setTermStructure(discounting_yts_handle)
+        else:
+            self.cachedCurves[curve] = CachedTermStructure(
+                discounting_yts_handle, cacheSize
+            )
         return self.curves[curve]
 
+    # cached discount factors and forward rates of a curve built with cacheSize
+    def cachedCurve(self, curve):
+        return self.cachedCurves[curve]
+
     # builc curve construction report
     def __buildDataReport(self, curve, data, instruments, yts, dayCounter):
 
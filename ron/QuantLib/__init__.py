@@ -1,18 +1,23 @@
 # #!/usr/bin/python
 
-# from YieldCurve import YieldCurve
+# from YieldCurve import YieldCurve, YieldCurveSnapshot, CachedTermStructure
 
 # from Swap import Swap
 
 # from Helpers import Black, Bachelier, BlackImpliedVol, BachelierImpliedVol
+# from Helpers import BlackDelta, BlackGamma, BlackVega, BachelierVega, BachelierDelta, BachelierGamma
 
-# from MCSimulation import MCSimulation
+# from MCSimulation import MCSimulation, MCStreamingSimulation
+
+# from RandomNumbers import PseudoRandomNumbers, SobolBrownianBridge, BrownianBridge, AntitheticNumbers
 
 # from SabrModel import SabrModel
 
-# from HullWhiteModel import HullWhiteModel, HullWhiteModelWithDiscreteNumeraire
+# from SabrCalibration import SabrSmileCalibration, SabrCubeCalibration
+
+# from HullWhiteModel import HullWhiteModel, HullWhiteModelWithDiscreteNumeraire, HullWhiteModelWithExactNumeraire
 
-# from Payoffs import Pay, VanillaOption, CouponBond
+# from Payoffs import Pay, VanillaOption, CouponBond, ZeroBondOptionControl, CouponBondOptionControl
 
 # from BermudanOption import BermudanOption, EuropeanPayoff
 
@@ -22,6 +27,6 @@
 
 # from PDESolver import PDESolver
 
-# from AMCSolver import AMCSolver, AMCSolverOnlyExerciseRegression, AMCSolverCoterminalRateRegression, AMCSolverCoterminalRateOnlyExerciseRegression
+# from AMCSolver import AMCSolver, AMCSolverOnlyExerciseRegression, AMCSolverCoterminalRateRegression, AMCSolverCoterminalRateOnlyExerciseRegression, StateRegressors, CoterminalRateLiborRegressors, CoterminalRateOptionRegressors, ContinuationValueRegression, ExerciseRegression
 
 # from Regression import Regression, MultiIndexSet
@@ -0,0 +1,73 @@
+"""."""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "..", "ron", "QuantLib")
+)
+from HullWhiteModel import HullWhiteModelWithExactNumeraire  # noqa: E402
+
+
+class NelsonSiegelCurve:
+    """."""
+
+    # f(t) = 0.03 - 0.01 exp(-t/5) with analytic discount factors
+
+    def discount(self, t):
+        """."""
+        return np.exp(-(0.03 * t - 0.05 * (1.0 - np.exp(-t / 5.0))))
+
+    def forwardRate(self, t):
+        """."""
+        return 0.03 - 0.01 * np.exp(-t / 5.0)
+
+
+CURVE = NelsonSiegelCurve()
+MODEL = HullWhiteModelWithExactNumeraire(
+    CURVE, 0.05, [1.0, 2.0, 5.0, 10.0], [0.01, 0.012, 0.009, 0.011]
+)
+# steps within a volatility piece, across pieces and beyond the last one
+STEPS = [[0.0, 0.5], [0.0, 10.0], [0.5, 1.5], [1.5, 7.0], [3.0, 3.25], [8.0, 20.0]]
+
+
+def testStepMomentsReproduceZeroBonds():
+    """."""
+    x0 = np.array([-0.03, 0.0, 0.02])
+    for [t0, t1] in STEPS:
+        [GPrime, integral, stdX, beta, stdI, G, mu, logDiscount] = (
+            MODEL.stepCoefficients(t0, t1)
+        )
+        # x(t1) conditional on x(t0)
+        assert (
+            np.max(
+                np.abs(
+                    GPrime * x0 + integral - MODEL.riskNeutralExpectationX(t0, x0, t1)
+                )
+            )
+            < 1.0e-15
+        )
+        assert abs(stdX**2 - MODEL.varianceX(t0, t1)) < 1.0e-15
+        # s(t1) - s(t0) = logDiscount + I is Gaussian, its exponential moment
+        # E[exp{-(s(t1) - s(t0))} | x(t0)] is the zero bond P(t0, t1)
+        varI = (beta * stdX) ** 2 + stdI**2
+        bond = np.exp(-logDiscount - G * x0 - mu + 0.5 * varI)
+        assert np.max(np.abs(bond / MODEL.zeroBond(t0, x0, t1) - 1.0)) < 1.0e-13
+
+
+def testSimulatedNumeraireReproducesDiscountFactors():
+    """."""
+    times = np.array([0.0, 1.0, 3.0, 7.0, 10.0, 20.0])
+    coefficients = MODEL.prepare(times)
+    rng = np.random.Generator(np.random.PCG64(123))
+    nPaths = 2**16
+    X = np.zeros([2 * nPaths, 2])
+    for j in range(len(times) - 1):
+        dW = rng.standard_normal([nPaths, MODEL.factors()])
+        X = MODEL.evolvePrepared(coefficients[j], X, np.concatenate([dW, -dW]))
+        deflated = 1.0 / MODEL.numeraireBatch(X)
+        pairs = 0.5 * (deflated[:nPaths] + deflated[nPaths:])
+        stdErr = np.std(pairs) / np.sqrt(nPaths)
+        assert abs(np.mean(deflated) - CURVE.discount(times[j + 1])) < 4.0 * stdErr
@@ -0,0 +1,103 @@
+"""."""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "..", "ron", "QuantLib")
+)
+from Helpers import (  # noqa: E402
+    Bachelier,
+    BachelierImpliedVol,
+    Black,
+    BlackImpliedVol,
+    SafeguardedNewton,
+)
+
+FORWARD = 0.03
+STRIKES = np.array([0.005, 0.01, 0.02, 0.03, 0.04, 0.06, 0.1])[:, np.newaxis]
+TIMES = np.array([0.25, 1.0, 5.0, 30.0])[:, np.newaxis, np.newaxis]
+
+
+def testSafeguardedNewton():
+    """."""
+    # f(s) = ln(s^2 / c) has a poor Newton step far from the root
+    c = np.array([1.0e-8, 1.0e-2, 1.0, 1.0e4])
+
+    def objective(s):
+        f = np.log(s * s / c)
+        return [f, f * s / 2.0]
+
+    s = SafeguardedNewton(objective, np.full(c.shape, 1.0))
+    assert np.max(np.abs(s / np.sqrt(c) - 1.0)) < 1.0e-12
+
+
+def roundTrip(price, impliedVol, sigmas):
+    """."""
+    # out-of-the-money quotes are inverted to full precision, in-the-money
+    # quotes lose their time value to rounding and are checked by repricing
+    otm = np.where(STRIKES > FORWARD, 1.0, -1.0)
+    prices = price(STRIKES, FORWARD, sigmas, TIMES, otm)
+    vols = impliedVol(prices, STRIKES, FORWARD, TIMES, otm)
+    assert vols.shape == (4, 7, 4)
+    # far out-of-the-money prices underflow to zero, i.e. zero volatility
+    errors = np.where(prices > 0.0, np.abs(vols / sigmas - 1.0), vols)
+    assert np.max(errors) < 1.0e-10
+    prices = price(STRIKES, FORWARD, sigmas, TIMES, -otm)
+    vols = impliedVol(prices, STRIKES, FORWARD, TIMES, -otm)
+    repriced = price(STRIKES, FORWARD, vols, TIMES, -otm)
+    # prices rounded below intrinsic value are arbitrage violations
+    intrinsic = price(STRIKES, FORWARD, 0.0, TIMES, -otm)
+    assert np.all(np.isnan(vols) == (prices < intrinsic))
+    errors = np.where(prices < intrinsic, 0.0, np.abs(repriced - prices))
+    assert np.max(errors) < 1.0e-15
+
+
+def testBlackImpliedVolRoundTrip():
+    """."""
+    roundTrip(Black, BlackImpliedVol, np.array([0.05, 0.2, 0.5, 1.0]))
+
+
+def testBachelierImpliedVolRoundTrip():
+    """."""
+    roundTrip(Bachelier, BachelierImpliedVol, np.array([0.0005, 0.005, 0.01, 0.05]))
+
+
+def testImpliedVolArbitrageBounds():
+    """."""
+    strikes = np.array([0.02, 0.03, 0.04])
+    callOrPut = np.array([1.0, -1.0, 1.0])
+    intrinsic = np.maximum(callOrPut * (FORWARD - strikes), 0.0)
+    for impliedVol in [BlackImpliedVol, BachelierImpliedVol]:
+        # price == intrinsic gives zero volatility
+        vols = impliedVol(intrinsic, strikes, FORWARD, 1.0, callOrPut)
+        assert np.all(vols == 0.0)
+        # price below intrinsic value and expired options give NaN
+        vols = impliedVol(intrinsic - 1.0e-4, strikes, FORWARD, 1.0, callOrPut)
+        assert np.all(np.isnan(vols))
+        vols = impliedVol(intrinsic + 1.0e-4, strikes, FORWARD, 0.0, callOrPut)
+        assert np.all(np.isnan(vols))
+    # Black call prices are bounded by the forward, put prices by the strike
+    bounds = np.where(callOrPut > 0.0, FORWARD, strikes)
+    vols = BlackImpliedVol(bounds, strikes, FORWARD, 1.0, callOrPut)
+    assert np.all(np.isnan(vols))
+    # mixed valid and invalid inputs are solved in a single call
+    prices = Black(strikes, FORWARD, 0.2, 1.0, callOrPut)
+    prices = np.where([True, False, True], prices, intrinsic - 1.0e-4)
+    vols = BlackImpliedVol(prices, strikes, FORWARD, 1.0, callOrPut)
+    assert np.all(np.abs(vols[[0, 2]] - 0.2) < 1.0e-10)
+    assert np.isnan(vols[1])
+
+
+def testImpliedVolScalarInput():
+    """."""
+    price = Bachelier(0.03, FORWARD, 0.01, 2.0, 1.0)
+    vol = BachelierImpliedVol(price, 0.03, FORWARD, 2.0, 1.0)
+    assert np.ndim(vol) == 0
+    assert abs(vol - 0.01) < 1.0e-14
+    price = Black(0.04, FORWARD, 0.3, 2.0, 1.0)
+    vol = BlackImpliedVol(price, 0.04, FORWARD, 2.0, 1.0)
+    assert np.ndim(vol) == 0
+    assert abs(vol - 0.3) < 1.0e-12
@@ -0,0 +1,61 @@
+"""."""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "..", "ron", "QuantLib")
+)
+from SabrModel import SabrModel  # noqa: E402
+
+# [forward, timeToExpiry, alpha, beta, nu, rho, shift]
+SMILES = [
+    [0.03, 5.0, 0.01, 0.5, 0.3, -0.2, 0.0],
+    [0.03, 5.0, 0.01, 0.3, 0.4, -0.3, 0.01],
+    [0.01, 20.0, 0.006, 0.0, 0.6, 0.3, 0.02],
+    [0.02, 10.0, 0.02, 0.5, 0.8, -0.5, 0.0],
+]
+
+
+def rateGrid(smile):
+    """."""
+    return np.linspace(-smile[6] + 1.0e-3, 0.5, 5001)
+
+
+def testArbitrageFreeDensityIsMartingale():
+    """."""
+    for smile in SMILES:
+        model = SabrModel(*smile)
+        rates = rateGrid(smile)
+        density = model.density(rates, arbitrageFree=True)
+        assert np.min(density) >= 0.0
+        assert abs(np.trapezoid(density, rates) - 1.0) < 1.0e-12
+        assert abs(np.trapezoid(density * rates, rates) - smile[0]) < 1.0e-12
+
+
+def testArbitrageFreeDensityReproducesSmile():
+    """."""
+    smile = SMILES[0]
+    model = SabrModel(*smile)
+    rates = rateGrid(smile)
+    density = model.density(rates, arbitrageFree=True)
+    strikes = np.linspace(smile[0] - 0.01, smile[0] + 0.02, 7)
+    calls = np.trapezoid(
+        density * np.maximum(rates[np.newaxis, :] - strikes[:, np.newaxis], 0.0),
+        rates,
+        axis=-1,
+    )
+    assert np.max(np.abs(calls - model.vanillaPrice(strikes, 1.0))) < 1.0e-5
+
+
+def testArbitrageFreeDensityForManyForwards():
+    """."""
+    smile = SMILES[0]
+    model = SabrModel(*smile)
+    rates = rateGrid(smile)
+    forwards = np.array([[0.02], [0.03], [0.04]])
+    density = model.density(rates, forwards, arbitrageFree=True)
+    means = np.trapezoid(density * rates, rates, axis=-1)
+    assert np.max(np.abs(means - forwards[:, 0])) < 1.0e-12